@@ -90,106 +90,78 @@ class MinimalBlock():
             t.write()
 
 class Tree(object):
-    def __init__(self, value, childrenlist = [], genesis=False):
+    def __init__(self, value, genesis=False):
         self.value = value          # Minimal block
-        self.balances = {}
-        self.longestChild = None
-        self.children_len = {}
+        self.height = 0             # absolute height (genesis = 0)
+        self.seq = 0                # insertion order in the blockchain (fork-choice tie break)
+        self.deltas = {}            # balance changes made by this block
+        self.checkpoint = None      # full balance sheet, stored every BALANCE_CHECKPOINT blocks
         self.children = {}
         self.parent = None
-        maxl = -1
-
-        # Updates parent hash and max chain length for children blocks, sets the longest child as well
-        for i, child in enumerate(childrenlist):
-            hashkey = child.value.hash
-            self.children[hashkey] = child
-            self.children[hashkey].parent = self
-            self.children_len[hashkey]=self.get_max_length(child)
-            if (self.children_len[hashkey]>maxl):
-                self.longestChild = hashkey
 
         if (genesis):
+            self.checkpoint = {}
             for t in self.value.txns:
-                self.balances[t.payee] = t.amount
+                self.checkpoint[t.payee] = t.amount
 
 
-    def add_child(self, child, path=[]):
+    def add_child(self, child):
         '''
         Adds the child node to the children list 
-        Updates the longest child, balance and max chain length of child block
+        Updates the height and balance of child block
         '''
-        if len(path) == 0:
-            hashkey = child.value.hash
-            self.children[hashkey] = child
-            self.children[hashkey].parent = self
-            self.children_len[hashkey] = 1
-
-            if self.longestChild is None:
-                self.longestChild = hashkey
-            elif (self.children_len[hashkey] > self.children_len[self.longestChild]):
-                self.longestChild = hashkey
-
-            self.children[hashkey].update_balances()
-            self.children[hashkey].update_max_lengths()
-
-        else:
-            try:
-                self.children[path[0]].add_child(child, path[1:])
-            except KeyError:
-                print("!!!!!!!! KeyError")
+        hashkey = child.value.hash
+        self.children[hashkey] = child
+        self.children[hashkey].parent = self
+        self.children[hashkey].height = self.height + 1
+        self.children[hashkey].update_balances()
 
     def update_balances(self):
         '''
-        Uses parent block balances to update self block balances.
+        Records the balance changes made by the block wrt the parent block.
         Adds coinbase amount in miner's account at the end.
+        Stores a full balance sheet as checkpoint every BALANCE_CHECKPOINT blocks.
         '''
-        self.balances = self.parent.balances.copy()
+        deltas = {}
         for t in self.value.txns[1:]:
-            self.balances[t.drawee] -= t.amount
-            self.balances[t.payee] += t.amount
+            deltas[t.drawee] = deltas.get(t.drawee, 0) - t.amount
+            deltas[t.payee] = deltas.get(t.payee, 0) + t.amount
 
         t = self.value.txns[0]
-        self.balances[t.payee] += t.amount
+        deltas[t.payee] = deltas.get(t.payee, 0) + t.amount
+        self.deltas = deltas
 
-    def get_max_length(self):
-        '''
-        Returns the longest chain length starting from this block
-        '''
-        if (len(self.children_len)) == 0:
-            return 1
-        return self.children_len[self.longestChild] + 1
+        if self.height % BALANCE_CHECKPOINT == 0:
+            self.checkpoint = self.get_balances()
 
-    def update_max_lengths(self):
+    def get_balances(self):
         '''
-        Updates the longest chain length from the block downwards
+        Returns the balance sheet after this block (a new dict).
+        Rebuilt from the nearest checkpoint block by applying the deltas of the blocks after it.
         '''
-        maxl = -1
-        for i, key in enumerate(self.children):
-            self.children_len[key] = self.children[key].get_max_length()
-            if (self.children_len[key]>maxl):
-                maxl = self.children_len[key]
-                self.longestChild = key
+        path = []
+        node = self
+        while node.checkpoint is None:
+            path.append(node.deltas)
+            node = node.parent
 
-        if self.parent is not None:
-            self.parent.update_max_lengths()
+        balances = node.checkpoint.copy()
+        for deltas in reversed(path):
+            for account, delta in deltas.items():
+                balances[account] += delta
+        return balances
 
-    def get_path(self, fin_hash, path=[]):
+    def get_path(self):
         '''
-        Returns path (list of hashes) and the last block of the chain till fin_hash is encountered
-        Else returns -1,-1
+        Returns path (list of hashes) from the genesis block down to this block (genesis excluded)
         '''
-        if (self.value.hash) == fin_hash:
-            return [], self
-        elif len(self.children) == 0:
-            return -1, -1
-        elif fin_hash in self.children:
-            return path+[fin_hash], self.children[fin_hash]
-        else:
-            for i, child in enumerate(self.children):
-                retpath, child = self.children[child].get_path(fin_hash, path+[child])
-                if retpath != -1:
-                    return retpath, child
-            return -1, -1
+        path = []
+        node = self
+        while node.parent is not None:
+            path.append(node.value.hash)
+            node = node.parent
+        path.reverse()
+        return path
 
     def get_timestamps(self, path, retlist=[]):
         '''
@@ -215,6 +187,8 @@ class Tree(object):
 class MinimalChain():
     def __init__(self, time, genesis_txns): 
         self.blockchainTree = Tree(self.get_genesis_block(time, genesis_txns), genesis=True)
+        self.blocks = {self.blockchainTree.value.hash: self.blockchainTree}     # hash -> tree node index
+        self.tip = self.blockchainTree          # last block of the longest chain
         self.block_count = 1
     
     def write(self):
@@ -237,17 +211,34 @@ class MinimalChain():
         Adds a new block to the existing tree structure
         '''
 
+        if block.hash in self.blocks:
+            return
         newblock = Tree(block)
-        path, _ = self.blockchainTree.get_path(block.previous_hash)
-        self.blockchainTree.add_child(newblock, path)
+        newblock.seq = self.block_count
+        self.blocks[block.previous_hash].add_child(newblock)
+        self.blocks[block.hash] = newblock
         self.block_count += 1
+        if self.is_longer(newblock, self.tip):
+            self.tip = newblock
+
+    def is_longer(self, node, tip):
+        '''
+        Fork choice: checks if node should replace tip as the end of the longest chain.
+        Longer chain wins, on equal length the branch added first at the fork point wins.
+        '''
+        if node.height != tip.height:
+            return node.height > tip.height
+        while node.parent is not tip.parent:
+            node = node.parent
+            tip = tip.parent
+        return node.seq < tip.seq
     
     def get_chain_size(self): 
         '''
         Returns longest chain size (exclude genesis block)
         '''
 
-        return self.blockchainTree.get_max_length() - 1
+        return self.tip.height
 
     def proofOfWork(self, block):
         return True
@@ -264,8 +255,8 @@ class MinimalChain():
         '''
 
         # prev hash valid
-        path, child = self.blockchainTree.get_path(block.previous_hash)
-        if path == -1:
+        child = self.blocks.get(block.previous_hash)
+        if child is None:
             if verbose:
                 print("** prev hash not found")
             return 1
@@ -275,7 +266,7 @@ class MinimalChain():
             #     print("** same block received")
             return 2
 
-        balancesheet = child.balances.copy()
+        balancesheet = child.get_balances()
         # timestamp >= median of last 11
         timestamp_curr = block.timestamp
         timestamps_list = []
@@ -330,24 +321,14 @@ class MinimalChain():
         Returns hash of the last block of the longest chain to build a potential block on
         '''
 
-        parent = self.blockchainTree
-        while (len(parent.children)):
-            child = parent.children[parent.longestChild]
-            parent = child
-        return parent.value.hash
+        return self.tip.value.hash
 
     def longestChainAllHashes(self):
         '''
         Returns hashes of all longest chain block IDs 
         '''
 
-        allHashes = []
-        parent = self.blockchainTree
-        while (len(parent.children)):
-            child = parent.children[parent.longestChild]
-            allHashes.append(child.value.hash)
-            parent = child
-        return allHashes
+        return self.tip.get_path()
 
     def verifyTxn(self, txnlist): 
         '''
@@ -356,11 +337,7 @@ class MinimalChain():
         Also maintains the coinbase transaction balance in the balance sheet
         '''
 
-        parent = self.blockchainTree
-        while (len(parent.children)):
-            child = parent.children[parent.longestChild]
-            parent = child
-        balancesheet = parent.balances.copy()
+        balancesheet = self.tip.get_balances()
         # print(balancesheet)
 
         ret = []
@@ -375,7 +352,6 @@ class MinimalChain():
                 balancesheet[t.drawee] -= t.amount
                 balancesheet[t.payee] += t.amount
                 ret.append(True)
-        # print(parent.balances)
         return ret
 
         # also check if there is no txn in the blockchain so far with the same txnID
@@ -387,9 +363,9 @@ class MinimalChain():
         '''
 
         miners = []
-        parent = self.blockchainTree
-        while (len(parent.children)):
-            child = parent.children[parent.longestChild]
-            parent = child
-            miners.append(child.value.txns[0].payee)
+        node = self.tip
+        while node.parent is not None:
+            miners.append(node.value.txns[0].payee)
+            node = node.parent
+        miners.reverse()
         return miners
\ No newline at end of file
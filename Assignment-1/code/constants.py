@@ -6,6 +6,7 @@ kb = 1000
 mb = 10^6
 MINING_FEE = 5
 eps = 1e-8
+BALANCE_CHECKPOINT = 32    # full balance sheet stored every 32 blocks (deltas in between)
 
 ######################################################
 
@@ -22,9 +22,9 @@ blk = MinimalBlock(blkID, 3, [txn], blockchain.longestChainHash())
 blk.addCoinbaseTxn('cb'+str(nodeID)+'_'+str(blkID), nodeID, 3)
 
 
-print(blockchain.blockchainTree.balances)
+print(blockchain.blockchainTree.get_balances())
 blockchain.add_block(blk)
-print(blockchain.blockchainTree.balances)
+print(blockchain.blockchainTree.get_balances())
 
 blockchain.write()
 # print(blockchain.verifyTxn([txn]))
@@ -26,7 +26,7 @@ def plot_ratio(nodeIDs, miner_info, blockchains):
 
 	print(f'''\n---------------------------\nNODE DETAILS: \nblocks mined: {blocks_mined}\nis fast: {is_fast}\nhash power: {[float('{:.2f}'.format(x)) for x in hash_power]}\n''')
 	print('---------------------------\nLONGEST CHAIN DETAILS: \n')
-	print(blockchains[0].blockchainTree.children_len)
+	print(blockchains[0].get_chain_size())
 	for i, blockchain in enumerate(blockchains):
 		singleMine = blockchain.longestChainMiners()
 
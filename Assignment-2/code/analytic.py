@@ -0,0 +1,242 @@
+'''
+Analytical revenue of the selfish and stubborn adversaries, from the Markov chain of the attack
+(Eyal & Sirer, "Majority is not enough"; Nayak et al., "Stubborn mining"), for a single adversary of
+hash power fraction alpha whose released blocks win a tie against gamma of the honest hash power.
+Gives the expected adv_fraction (revenue share), MPU_adv and MPU_overall of a long run with no
+propagation delays, over a whole (alpha, gamma) grid at once, and how far simulation results are from it.
+In the simulation gamma is ADV_GAMMA, the fraction of honest nodes connected to the adversary, which only
+approximates the fraction of honest hash power mining on its block in a tie.
+'''
+import argparse
+import glob
+import json
+import os
+import time
+import numpy as np
+from constants import *
+
+POLICIES = ['selfish', 'stubborn']
+TRAIL = 1		# attacks.StubbornNode keeps mining its branch one block behind, adopts two behind
+
+def selfish_revenue(alpha, gamma):
+	'''
+	Eyal-Sirer closed form of the selfish pool's revenue share (alpha < 1/2)
+	'''
+	alpha, gamma = np.asarray(alpha, dtype=float), np.asarray(gamma, dtype=float)
+	return (alpha*(1 - alpha)**2*(4*alpha + gamma*(1 - 2*alpha)) - alpha**3)/(1 - alpha*(1 + (2 - alpha)*alpha))
+
+def selfish_rewards(alpha, gamma):
+	'''
+	Expected main chain blocks of the adversary and of the honest miners per mined block, from the
+	stationary distribution of the Eyal-Sirer chain (states 0, 0', 1, 2, ...; alpha < 1/2)
+	'''
+	alpha, gamma = np.asarray(alpha, dtype=float), np.asarray(gamma, dtype=float)
+	q = alpha/(1 - alpha)
+	p0 = (1 - 2*alpha)/(2*alpha**3 - 4*alpha**2 + 1)
+	p1 = alpha*p0
+	p0_ = (1 - alpha)*p1			# tie after the honest miners matched the lead of 1
+	p2 = q*p1
+	p3_on = p1*q**2/(1 - q)			# states 3, 4, ...
+	adv = p0_*(2*alpha + gamma*(1 - alpha)) + 2*(1 - alpha)*p2 + (1 - alpha)*p3_on
+	honest = p0*(1 - alpha) + p0_*(1 - alpha)*(2 - gamma)
+	return adv, honest
+
+def chain_states(policy, max_lead, trail=TRAIL):
+	'''
+	Attack chain on (d, f): the adversary's lead d = a - h over the h honest blocks since the fork, f = (h > 0)
+	(a >= h > 0: the adversary released h blocks and the tie is public). The decisions only depend on (d, f),
+	the blocks settled into the main chain are linear in h, so h is kept out of the states.
+	Events are an adversary block, an honest block on the released adversary branch (only in a public tie)
+	and an honest block on the public branch. For each state and event returns the next state index, the new h
+	(h + step, or reset to a constant) and the settled adversary and honest blocks (coefficient of h, constant).
+	The stubborn adversary only matches (lead-stubborn) and keeps mining its branch until it trails by
+	more than trail blocks, the selfish one overrides as soon as its lead drops to 1.
+	Adversary blocks beyond a lead of max_lead are dropped (truncation).
+	'''
+	lag = trail if policy == 'stubborn' else 0
+
+	def settle(d, f, h, adv):
+		'''
+		Adversary decision at lead d with h = (coefficient, constant) honest blocks since the fork
+		'''
+		if d < -lag:
+			return (0, False), ('reset', 0), adv, h			# adopts the public chain
+		if policy == 'selfish' and f and d == 1:
+			# overrides with its whole branch, a = d + h
+			return (0, False), ('reset', 0), (adv[0] + h[0], adv[1] + h[1] + d), (0, 0)
+		return (d, f), None, adv, (0, 0)
+
+	def step(d, f, event):
+		if event == 'adv':
+			state, reset, adv, honest = settle(min(d + 1, max_lead), f, (1, 0), (0, 0))
+			return state, reset or ('step', 0), adv, honest
+		if event == 'gamma' and f and d >= 0:
+			# the released h blocks are built on: settled for the adversary, the fork restarts after them
+			state, reset, adv, honest = settle(d - 1, True, (0, 1), (1, 0))
+			return state, reset or ('reset', 1), adv, honest
+		if not f and d == 0:
+			return (0, False), ('reset', 0), (0, 0), (0, 1)
+		state, reset, adv, honest = settle(d - 1, True, (1, 1), (0, 0))
+		return state, reset or ('step', 1), adv, honest
+
+	events = ['adv', 'gamma', 'honest']
+	states = [(0, False)]
+	index = {(0, False): 0}
+	rows = []
+	i = 0
+	while i < len(states):
+		row = []
+		for event in events:
+			nxt, h, adv, honest = step(*states[i], event)
+			if nxt not in index:
+				index[nxt] = len(states)
+				states.append(nxt)
+			row.append((index[nxt], h[0] == 'reset', h[1], adv[0], adv[1], honest[0], honest[1]))
+		rows.append(row)
+		i += 1
+	table = np.array(rows, dtype=float)			# (states, events, fields)
+	return states, {
+		'next': table[:, :, 0].astype(int),
+		'reset': table[:, :, 1].astype(bool),
+		'h': table[:, :, 2],					# new h if reset, else its increment
+		'adv_h': table[:, :, 3], 'adv': table[:, :, 4],
+		'honest_h': table[:, :, 5], 'honest': table[:, :, 6],
+	}
+
+def chain_rewards(policy, alpha, gamma, max_lead=40, trail=TRAIL):
+	'''
+	Expected main chain blocks of the adversary and of the honest miners per mined block, for arrays
+	of alpha and gamma. The stationary distributions pi of the whole grid are solved in one batched solve,
+	then mu(s) = E[h; s] in a second one: mu(s') = sum over transitions s -> s' of p (mu(s) + step pi(s)),
+	or p h pi(s) where h is reset.
+	'''
+	alpha, gamma = np.broadcast_arrays(np.asarray(alpha, dtype=float), np.asarray(gamma, dtype=float))
+	shape = alpha.shape
+	alpha, gamma = alpha.ravel(), gamma.ravel()
+	states, t = chain_states(policy, max_lead, trail)
+	G, S = len(alpha), len(states)
+	rows = np.arange(S)
+	# event probabilities (grid, events)
+	prob = np.stack([alpha, (1 - alpha)*gamma, (1 - alpha)*(1 - gamma)], axis=1)
+	P = np.zeros((G, S, S))
+	C = np.zeros((G, S, S))			# transitions that keep h
+	for e in range(prob.shape[1]):
+		np.add.at(P, (slice(None), rows, t['next'][:, e]), prob[:, e, None])
+		np.add.at(C, (slice(None), rows, t['next'][:, e]), prob[:, e, None]*~t['reset'][:, e])
+	# pi (P - I) = 0 with sum(pi) = 1 replacing the last equation
+	A = np.transpose(P, (0, 2, 1)) - np.eye(S)
+	A[:, -1, :] = 1
+	b = np.zeros((G, S))
+	b[:, -1] = 1
+	pi = np.linalg.solve(A, b[..., None])[..., 0]
+	# (I - C^T) mu = b, b(s') = sum of p pi(s) h over the transitions into s'
+	b = np.zeros((G, S))
+	for e in range(prob.shape[1]):
+		np.add.at(b, (slice(None), t['next'][:, e]), prob[:, e, None]*pi*t['h'][:, e])
+	mu = np.linalg.solve(np.eye(S) - np.transpose(C, (0, 2, 1)), b[..., None])[..., 0]
+	adv_rate = np.einsum('ge,gs,se->g', prob, mu, t['adv_h']) + np.einsum('ge,gs,se->g', prob, pi, t['adv'])
+	honest_rate = np.einsum('ge,gs,se->g', prob, mu, t['honest_h']) + np.einsum('ge,gs,se->g', prob, pi, t['honest'])
+	return adv_rate.reshape(shape), honest_rate.reshape(shape)
+
+def expected_metrics(policy, alpha, gamma, max_lead=40, trail=TRAIL):
+	'''
+	Expected adv_fraction, MPU_adv and MPU_overall (as in visualise.plot_ratio) for arrays of alpha and gamma.
+	The selfish chain uses its closed form. With alpha >= 1/2 the adversary's lead grows without bound and
+	in the long run the chain holds only (all) its blocks.
+	'''
+	alpha, gamma = np.broadcast_arrays(np.asarray(alpha, dtype=float), np.asarray(gamma, dtype=float))
+	minority = alpha < 0.5
+	a, g = np.where(minority, alpha, 0.25), gamma			# any valid point where the limit applies
+	if policy == 'selfish':
+		adv, honest = selfish_rewards(a, g)
+	else:
+		adv, honest = chain_rewards(policy, a, g, max_lead, trail)
+	return {
+		'adv_fraction': np.where(minority, adv/(adv + honest), 1.0),
+		'MPU_adv': np.where(minority, adv/np.maximum(alpha, eps), 1.0),
+		'MPU_overall': np.where(minority, adv + honest, alpha),
+	}
+
+def load_results(paths):
+	'''
+	Simulation results to compare: summary.json files (main.py -summary, sweep and ensemble points, searched
+	for in directories) and ensemble.json files. Returns (source, policy, alpha, gamma, {metric: (mean, ci width)})
+	'''
+	files = []
+	for path in paths:
+		if os.path.isdir(path):
+			files += sorted(glob.glob(os.path.join(path, '**', 'summary.json'), recursive=True))
+			files += sorted(glob.glob(os.path.join(path, '**', 'ensemble.json'), recursive=True))
+		else:
+			files.append(path)
+	results = []
+	for path in files:
+		with open(path) as f:
+			data = json.load(f)
+		if 'stats' in data:
+			# ensemble: its points use the adversary defaults
+			policy = data['config'].get('mode')
+			alpha, gamma = ADV_HASH_POWER, ADV_GAMMA
+			metrics = {m: (s['mean'], s['ci_width']) for m, s in data['stats'].items()}
+		else:
+			config = data.get('config', {})
+			policy = 'selfish' if config.get('selfish') else 'stubborn' if config.get('stubborn') else None
+			alpha, gamma = config.get('adv_hash_power', ADV_HASH_POWER), config.get('adv_gamma', ADV_GAMMA)
+			metrics = {m: (data[m], None) for m in ['adv_fraction', 'MPU_adv', 'MPU_overall'] if data.get(m) is not None}
+		if policy in POLICIES:
+			results.append((path, policy, alpha, gamma, metrics))
+	return results
+
+def compare(results, max_lead=40, trail=TRAIL):
+	'''
+	Prints each simulation metric next to its expected value, returns the rows
+	(source, policy, alpha, gamma, metric, simulated, expected, deviation in ci widths or None)
+	'''
+	rows = []
+	print("{:<48}{:<10}{:>6}{:>6}  {:<14}{:>8}{:>8}{:>9}{:>8}".format('result', 'mode', 'alpha', 'gamma', 'metric', 'sim', 'theory', 'diff', 'diff/ci'))
+	for path, policy, alpha, gamma, metrics in results:
+		expected = expected_metrics(policy, alpha, gamma, max_lead, trail)
+		for metric, (value, ci_width) in metrics.items():
+			if metric not in expected:
+				continue
+			theory = float(expected[metric])
+			ci_dev = (value - theory)/ci_width if ci_width else None
+			rows.append((path, policy, alpha, gamma, metric, value, theory, ci_dev))
+			source = os.path.relpath(path)
+			source = source if len(source) < 48 else '...' + source[-44:]
+			print("{:<48}{:<10}{:>6.2f}{:>6.2f}  {:<14}{:>8.4f}{:>8.4f}{:>+9.4f}{:>8}".format(source, policy, alpha, gamma, metric,
+				value, theory, value - theory, "{:+.1f}".format(ci_dev) if ci_dev is not None else '-'))
+	return rows
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Expected selfish/stubborn revenue from the Markov chain of the attack')
+	parser.add_argument('-mode', metavar='M', type=str, nargs='+', default=POLICIES, choices=POLICIES, help='adversary modes')
+	parser.add_argument('-alpha', metavar='A', type=float, nargs='+', default=list(np.round(np.arange(0.05, 0.5, 0.05), 2)), help='adversary hash power fractions')
+	parser.add_argument('-gamma', metavar='G', type=float, nargs='+', default=[0.0, 0.5, 1.0], help='fractions of honest hash power mining on the adversary block in a tie')
+	parser.add_argument('-maxlead', metavar='K', type=int, default=40, help='largest adversary branch kept in the stubborn chain')
+	parser.add_argument('-trail', metavar='T', type=int, default=TRAIL, help='blocks the stubborn adversary keeps mining its branch while behind (0: lead-stubborn only)')
+	parser.add_argument('-out', metavar='O', type=str, default=None, help='CSV file for the grid')
+	parser.add_argument('-compare', metavar='C', type=str, nargs='+', default=None, help='summary.json/ensemble.json files or sweep/ensemble directories to compare with theory')
+	args = parser.parse_args()
+
+	if args.compare:
+		compare(load_results(args.compare), args.maxlead, args.trail)
+	else:
+		alpha, gamma = np.meshgrid(args.alpha, args.gamma, indexing='ij')
+		lines = []
+		print("{:<10}{:>7}{:>7}{:>14}{:>10}{:>13}".format('mode', 'alpha', 'gamma', 'adv_fraction', 'MPU_adv', 'MPU_overall'))
+		for policy in args.mode:
+			start = time.perf_counter()
+			expected = expected_metrics(policy, alpha, gamma, args.maxlead, args.trail)
+			elapsed = time.perf_counter() - start
+			for i, j in np.ndindex(alpha.shape):
+				row = [policy, alpha[i, j], gamma[i, j]] + [expected[m][i, j] for m in ['adv_fraction', 'MPU_adv', 'MPU_overall']]
+				lines.append(row)
+				print("{:<10}{:>7.2f}{:>7.2f}{:>14.4f}{:>10.4f}{:>13.4f}".format(*row))
+			print("{}: {} points in {:.1f} ms".format(policy, alpha.size, 1e3*elapsed))
+		if args.out:
+			with open(args.out, 'w') as f:
+				f.write("mode,alpha,gamma,adv_fraction,MPU_adv,MPU_overall\n")
+				f.writelines("{},{},{},{},{},{}\n".format(*row) for row in lines)
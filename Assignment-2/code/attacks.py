@@ -1,24 +1,23 @@
 import numpy as np 
 from chain import MinimalTxn, MinimalBlock, MinimalChain
-from network import compute_latency
 from constants import *
 from node import Node
 
-np.random.seed(SEED)
 
 class SelfishNode(Node):
-	def __init__(self, env, call, nodeID, genesis_txns, peers = {}, is_fast = False, hash_power = 0.1):
-		super().__init__(env, call, nodeID, genesis_txns, peers = peers, is_fast = is_fast, hash_power = hash_power)
+	def __init__(self, sim, nodeID, genesis_txns, is_fast = False, hash_power = 0.1, store = None, trace = None):
+		super().__init__(sim, nodeID, genesis_txns, is_fast = is_fast, hash_power = hash_power, store = store, trace = trace)
 		self.is_prime = False
 
 	def addToBlockchain(self, block, sent_by):
 		'''
-		Update log list and add block to blockchain
+		Record block arrival in the trace and add block to blockchain
 		'''
 		if sent_by == None:
 			sent_by = self.nodeID
 		self.blocks_received += 1
-		self.logs.append(",".join([block.hash, str(self.blocks_received), str("{:.2f}".format(self.env.now)), block.previous_hash, str(block.txns[0].payee)])+'\n')
+		if self.trace is not None:
+			self.trace.write(self.nodeID, block, self.env.now)
 
 		# a, h, c
 		# h = self.blockchain.get_public_chain_size()
@@ -79,7 +78,7 @@ class SelfishNode(Node):
 
 
 	def freeze_mine(self):
-		self.interrupt_time = self.env.now
+		self.interrupt_mining()
 		block_list = self.blockchain.release_pvt()		# release all pvt blocks
 		# print("releasing all private blks, selfish", len(block_list))
 		for blk in block_list:
@@ -101,19 +100,20 @@ class SelfishNode(Node):
 
 
 class StubbornNode(Node):
-	def __init__(self, env, call, nodeID, genesis_txns, peers = {}, is_fast = False, hash_power = 0.1):
-		super().__init__(env, call, nodeID, genesis_txns, peers = peers, is_fast = is_fast, hash_power = hash_power)
+	def __init__(self, sim, nodeID, genesis_txns, is_fast = False, hash_power = 0.1, store = None, trace = None):
+		super().__init__(sim, nodeID, genesis_txns, is_fast = is_fast, hash_power = hash_power, store = store, trace = trace)
 		self.crossed_negative = False
 		self.is_prime = False
 
 	def addToBlockchain(self, block, sent_by):
 		'''
-		Update log list and add block to blockchain
+		Record block arrival in the trace and add block to blockchain
 		'''
 		if sent_by == None:
 			sent_by = self.nodeID
 		self.blocks_received += 1
-		self.logs.append(",".join([block.hash, str(self.blocks_received), str("{:.2f}".format(self.env.now)), block.previous_hash, str(block.txns[0].payee)])+'\n')
+		if self.trace is not None:
+			self.trace.write(self.nodeID, block, self.env.now)
 
 		# a, h, c
 		# h = self.blockchain.get_public_chain_size()
@@ -144,7 +144,7 @@ class StubbornNode(Node):
 					# do nothing, stick to pvt chain
 				elif lead == 0 or lead == -1:
 					self.is_prime=False
-					self.interrupt_time=self.env.now
+					self.interrupt_mining()
 					self.start_mining()
 					# do nothing, stick to longest chain
 					# release all pvt
@@ -178,7 +178,7 @@ class StubbornNode(Node):
 		self.crossed_negative = (lead<0)
 
 	def freeze_mine(self):
-		self.interrupt_time = self.env.now
+		self.interrupt_mining()
 		block_list = self.blockchain.release_pvt()		# release all pvt blocks
 		# print("releasing all private blks, stubborn", len(block_list))
 		for blk in block_list:
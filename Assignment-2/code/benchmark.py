@@ -0,0 +1,29 @@
+import argparse
+import re
+import subprocess
+import sys
+from kernel import KERNELS
+from constants import *
+
+def run_kernel(kernel, sim_args):
+	'''
+	Runs main.py with the given kernel, returns (events, wall time) parsed from its summary line
+	'''
+	out = subprocess.run([sys.executable, 'main.py', '-kernel', kernel] + sim_args, capture_output=True, text=True, check=True).stdout
+	match = re.search(r'kernel \w+: (\d+) events in ([\d.]+)s', out)
+	return int(match.group(1)), float(match.group(2))
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Events/sec of the event kernels on the same seed and configuration')
+	parser.add_argument('-n', metavar='N', type=int, default=N, help='Number of Peers in the network (> 1)')
+	parser.add_argument('-seed', metavar='S', type=int, default=SEED, help='random seed for simulations')
+	parser.add_argument('-repeat', metavar='R', type=int, default=3, help='runs per kernel (best is reported)')
+	args, extra = parser.parse_known_args()
+
+	sim_args = ['-n', str(args.n), '-seed', str(args.seed)] + extra
+	print("{:<8}{:>10}{:>10}{:>14}".format('kernel', 'events', 'wall(s)', 'events/sec'))
+	for kernel in KERNELS:
+		runs = [run_kernel(kernel, sim_args) for _ in range(args.repeat)]
+		events, wall_time = min(runs, key = lambda r: r[1])
+		print("{:<8}{:>10}{:>10.2f}{:>14.0f}".format(kernel, events, wall_time, events/max(wall_time, eps)))
@@ -0,0 +1,170 @@
+'''
+Scaling benchmark suite: runs simulation scenarios scaling N, the transaction rate, the mining delay and
+the adversaries, each in a fresh process, and records wall time, events/sec, simulated seconds per wall
+second and peak RSS into a JSON file. Results are compared against a stored baseline and slower (or
+bigger) scenarios are flagged as regressions.
+'''
+import argparse
+import contextlib
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+from kernel import KERNELS
+from logger import log, WARNING
+from simulation import SimulationConfig, Simulation
+from sweep import MODES
+from constants import *
+
+BASE = {'n': 100, 'txn_delay_mean': 10.0, 'mine_delay_mean': 300.0, 'mode': 'honest'}
+SWEEPS = {
+	'full': {'n': [10, 50, 100, 200, 500, 1000, 2000], 'txn_delay_mean': [1.0, 5.0, 10.0, 50.0], 'mine_delay_mean': [30.0, 100.0, 300.0, 1000.0], 'mode': ['honest', 'selfish', 'stubborn']},
+	'quick': {'n': [10, 50, 100], 'txn_delay_mean': [5.0, 10.0], 'mine_delay_mean': [100.0, 300.0], 'mode': ['honest', 'selfish', 'stubborn']},
+}
+MIN_BLOCKS = 10		# scenarios run for at least this many mean mining delays (so every node gets blocks)
+
+def scenarios(suite):
+	'''
+	Scenarios of the suite: the base scenario with one parameter swept at a time, by name
+	'''
+	result = {}
+	for key, values in SWEEPS[suite].items():
+		for value in values:
+			scenario = dict(BASE, **{key: value})
+			name = "n{n}_txn{txn_delay_mean:g}_mine{mine_delay_mean:g}_{mode}".format(**scenario)
+			result[name] = scenario
+	return result
+
+def scenario_endtime(scenario, endtime):
+	return max(endtime, MIN_BLOCKS*scenario['mine_delay_mean'])
+
+def run_scenario(scenario, endtime, kernel, seed):
+	'''
+	Runs one scenario (in a fresh worker process, for its peak RSS), returns its measurements
+	'''
+	log.configure(level = WARNING)
+	endtime = scenario_endtime(scenario, endtime)
+	with tempfile.TemporaryDirectory() as results_dir:
+		config = SimulationConfig(n = scenario['n'], txn_delay_mean = scenario['txn_delay_mean'], mine_delay_mean = scenario['mine_delay_mean'],
+			seed = seed, endtime = endtime, kernel = kernel, results_dir = results_dir, **MODES[scenario['mode']])
+		wall_start = time.perf_counter()
+		with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+			summary = Simulation(config).run()
+		wall_time = time.perf_counter() - wall_start
+	return {'endtime': endtime, 'wall_time': wall_time, 'events': summary['events'], 'events_per_sec': summary['events']/max(wall_time, eps),
+		'sim_per_wall': endtime/max(wall_time, eps), 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,
+		'chain_length': summary.get('chain_length')}
+
+def measure(scenario, endtime, kernel, seed, repeat):
+	'''
+	Best wall time of repeat runs (each in a new process), largest peak RSS
+	'''
+	runs = []
+	for _ in range(repeat):
+		with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+			runs.append(pool.submit(run_scenario, scenario, endtime, kernel, seed).result())
+	best = min(runs, key = lambda r: r['wall_time'])
+	return dict(best, peak_rss_mb = max(r['peak_rss_mb'] for r in runs))
+
+def machine_info():
+	try:
+		commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+	except OSError:
+		commit = None
+	return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit, 'python': platform.python_version(),
+		'numpy': np.__version__, 'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+def compare(results, baseline, time_tol, rss_tol):
+	'''
+	Compares the scenarios found in both, returns the regressions (scenario, metric, baseline, current),
+	failed scenarios included
+	'''
+	regressions = []
+	print("{:<36}{:>10}{:>10}{:>8}{:>10}{:>10}{:>8}".format('scenario', 'base(s)', 'now(s)', 'ratio', 'base(MB)', 'now(MB)', 'ratio'))
+	for name, current in results.items():
+		base = baseline.get(name)
+		if 'error' in current:
+			regressions.append((name, 'error', None, current['error']))
+			print("{:<36}failed: {}".format(name, current['error']))
+			continue
+		if base is None or 'error' in base:
+			continue
+		time_ratio = current['wall_time']/max(base['wall_time'], eps)
+		rss_ratio = current['peak_rss_mb']/max(base['peak_rss_mb'], eps)
+		flags = []
+		if time_ratio > 1 + time_tol:
+			regressions.append((name, 'wall_time', base['wall_time'], current['wall_time']))
+			flags.append('SLOWER')
+		if rss_ratio > 1 + rss_tol:
+			regressions.append((name, 'peak_rss_mb', base['peak_rss_mb'], current['peak_rss_mb']))
+			flags.append('BIGGER')
+		if current['events'] != base['events']:
+			flags.append('events {} -> {}'.format(base['events'], current['events']))
+		print("{:<36}{:>10.2f}{:>10.2f}{:>8.2f}{:>10.1f}{:>10.1f}{:>8.2f}  {}".format(name, base['wall_time'], current['wall_time'], time_ratio,
+			base['peak_rss_mb'], current['peak_rss_mb'], rss_ratio, ' '.join(flags)))
+	return regressions
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Scaling benchmark suite with regression check against a baseline')
+	parser.add_argument('-suite', metavar='S', type=str, default='quick', choices=list(SWEEPS.keys()), help='scenario set (quick or full, N up to 2000)')
+	parser.add_argument('-only', metavar='O', type=str, default=None, help='run only the scenarios matching the glob pattern O (e.g. n100_*)')
+	parser.add_argument('-endtime', metavar='T', type=float, default=2000, help='simulated seconds per scenario')
+	parser.add_argument('-kernel', metavar='K', type=str, default='heap', choices=list(KERNELS.keys()), help='event kernel')
+	parser.add_argument('-seed', metavar='S', type=int, default=SEED, help='random seed for simulations')
+	parser.add_argument('-repeat', metavar='R', type=int, default=1, help='runs per scenario (best wall time is kept)')
+	parser.add_argument('-out', metavar='O', type=str, default='../benchmarks/latest.json', help='results file')
+	parser.add_argument('-baseline', metavar='B', type=str, default='../benchmarks/baseline.json', help='baseline results to compare against')
+	parser.add_argument('-save', metavar='SV', type=bool, default=False, help='store the results as the new baseline')
+	parser.add_argument('-tol', metavar='TL', type=float, default=0.10, help='allowed wall time increase (fraction)')
+	parser.add_argument('-rsstol', metavar='RT', type=float, default=0.10, help='allowed peak RSS increase (fraction)')
+	args = parser.parse_args()
+
+	results = {}
+	print("{:<36}{:>10}{:>10}{:>14}{:>12}{:>10}".format('scenario', 'events', 'wall(s)', 'events/sec', 'sim/wall', 'RSS(MB)'))
+	for name, scenario in scenarios(args.suite).items():
+		if args.only and not fnmatch.fnmatchcase(name, args.only):
+			continue
+		try:
+			results[name] = dict(scenario, **measure(scenario, args.endtime, args.kernel, args.seed, args.repeat))
+		except Exception as e:
+			# recorded (and reported as a regression), the other scenarios still run
+			results[name] = dict(scenario, error=repr(e))
+			print("{:<36}failed: {!r}".format(name, e))
+			continue
+		r = results[name]
+		print("{:<36}{:>10}{:>10.2f}{:>14.0f}{:>12.1f}{:>10.1f}".format(name, r['events'], r['wall_time'], r['events_per_sec'], r['sim_per_wall'], r['peak_rss_mb']))
+
+	report = {'machine': machine_info(), 'settings': {'suite': args.suite, 'endtime': args.endtime, 'kernel': args.kernel, 'seed': args.seed, 'repeat': args.repeat}, 'results': results}
+	os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+	with open(args.out, 'w') as f:
+		json.dump(report, f, indent=1)
+	print("results in {}".format(args.out))
+
+	regressions = []
+	if os.path.exists(args.baseline):
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		if baseline['settings'] != report['settings']:
+			print("baseline settings {} differ from {}".format(baseline['settings'], report['settings']))
+		print("------------------------")
+		regressions = compare(results, baseline['results'], args.tol, args.rsstol)
+		print("{} regressions".format(len(regressions)) if regressions else "no regressions")
+	if args.save:
+		with open(args.baseline, 'w') as f:
+			json.dump(report, f, indent=1)
+		print("baseline saved to {}".format(args.baseline))
+	failed = [name for name, r in results.items() if 'error' in r]
+	if failed:
+		print("{} scenarios failed: {}".format(len(failed), ' '.join(failed)))
+	sys.exit(1 if regressions or failed else 0)
@@ -0,0 +1,120 @@
+'''
+Binary block arrival trace.
+<path>.trace holds fixed-width records (node, block, time, parent, miner), block and parent being block store numbers.
+<path>.hashes holds the 32 byte hash of every block store number, to convert back to the text logs.
+'''
+import os
+import sys
+import numpy as np
+
+RECORD = np.dtype([('node', '<i4'), ('block', '<i4'), ('time', '<f8'), ('parent', '<i4'), ('miner', '<i4')])
+HASH_SIZE = 32
+
+class TraceWriter():
+	'''
+	Buffered, append-only writer of block arrivals at the nodes
+	'''
+	def __init__(self, path, store, buffer_size=4096):
+		self.path = path
+		self.store = store
+		self.buffer_size = buffer_size
+		self.buffer = []
+		self.hashes = []
+		self.hashes_written = 0
+		self.trace_file = open(path+'.trace', 'wb')
+		self.hash_file = open(path+'.hashes', 'wb')
+
+	def write(self, nodeID, block, time):
+		'''
+		Records the arrival of block at node nodeID (the block is added to the store if new)
+		'''
+		store = self.store
+		num = store.add(block)
+		while self.hashes_written + len(self.hashes) < len(store):
+			self.hashes.append(bytes.fromhex(store.blocks[self.hashes_written + len(self.hashes)].hash))
+		self.buffer.append((nodeID, num, time, store.parent[num], block.txns[0].payee))
+		if len(self.buffer) >= self.buffer_size:
+			self.flush()
+
+	def flush(self):
+		if self.buffer:
+			self.trace_file.write(np.array(self.buffer, dtype=RECORD).tobytes())
+			self.buffer = []
+		if self.hashes:
+			self.hash_file.write(b''.join(self.hashes))
+			self.hashes_written += len(self.hashes)
+			self.hashes = []
+		self.trace_file.flush()
+		self.hash_file.flush()
+
+	def close(self):
+		self.flush()
+		self.trace_file.close()
+		self.hash_file.close()
+
+	def __getstate__(self):
+		'''
+		Pickled (simulation snapshots) without the files, with the sizes written so far
+		'''
+		self.flush()
+		state = self.__dict__.copy()
+		del state['trace_file'], state['hash_file']
+		state['sizes'] = (self.trace_file.tell(), self.hash_file.tell())
+		return state
+
+	def __setstate__(self, state):
+		'''
+		Reopens the files, dropping anything written after the snapshot
+		'''
+		trace_size, hash_size = state.pop('sizes')
+		self.__dict__.update(state)
+		self.trace_file = open(self.path+'.trace', 'r+b')
+		self.trace_file.truncate(trace_size)
+		self.trace_file.seek(trace_size)
+		self.hash_file = open(self.path+'.hashes', 'r+b')
+		self.hash_file.truncate(hash_size)
+		self.hash_file.seek(hash_size)
+
+
+def read_trace(path):
+	'''
+	Trace records as a memory-mapped structured array
+	'''
+	if os.path.getsize(path+'.trace') == 0:
+		return np.zeros(0, dtype=RECORD)
+	return np.memmap(path+'.trace', dtype=RECORD, mode='r')
+
+def read_hashes(path):
+	'''
+	Hex hashes indexed by block store number
+	'''
+	raw = np.fromfile(path+'.hashes', dtype=np.uint8).reshape(-1, HASH_SIZE)
+	return [row.tobytes().hex() for row in raw]
+
+def to_logs(path, nodeIDs):
+	'''
+	Converts the trace to the per node text logs (list of lines for each node in nodeIDs):
+		Block Hash, Block Number, Arrival/Mining Time, Previous Hash, Miner
+	'''
+	records = read_trace(path)
+	hashes = read_hashes(path)
+	logs = []
+	for nodeID in nodeIDs:
+		rows = records[records['node'] == nodeID]
+		logs.append([",".join([hashes[r['block']], str(k), "{:.2f}".format(r['time']), hashes[r['parent']], str(r['miner'])])+'\n' for k, r in enumerate(rows, 1)])
+	return logs
+
+def write_logs(path, nodeIDs, outdir="../results"):
+	'''
+	Writes blockchains_<id>.txt for each node from the trace
+	'''
+	for nodeID, lines in zip(nodeIDs, to_logs(path, nodeIDs)):
+		with open(os.path.join(outdir, f"blockchains_{nodeID}.txt"), 'w') as f:
+			f.writelines(lines)
+
+
+if __name__ == "__main__":
+	# python3 blocktrace.py <trace path> [output dir]
+	path = sys.argv[1]
+	records = read_trace(path)
+	write_logs(path, sorted(set(records['node'].tolist())), sys.argv[2] if len(sys.argv) > 2 else "../results")
@@ -1,11 +1,40 @@
 import hashlib
+import struct
+import numpy as np
+from array import array
+from bisect import insort
+from collections import deque
 from statistics import median
 from constants import *
+from logger import log
 import sys
 from typing import NamedTuple
 sys.setrecursionlimit(10000)
 
+def encodeField(value):
+    '''
+    Canonical byte encoding of an ID field (int, numpy int or string), type tagged
+    '''
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+        return b's' + struct.pack('<H', len(data)) + data
+    return b'i' + struct.pack('<q', value)
+
+def merkleRoot(digests):
+    '''
+    Combines transaction digests pairwise (last one repeated on odd levels) into the merkle root
+    '''
+    if len(digests) == 0:
+        return hashlib.sha256(b'').digest()
+    while len(digests) > 1:
+        if len(digests) % 2:
+            digests = digests + [digests[-1]]
+        digests = [hashlib.sha256(digests[i] + digests[i+1]).digest() for i in range(0, len(digests), 2)]
+    return digests[0]
+
 class MinimalTxn():
+    __slots__ = ('txnID', 'drawee', 'payee', 'timestamp', 'amount', 'commission', '_digest')
+
     def __init__(self, txnID, drawee, payee, timestamp, amount, commission):
         self.txnID = txnID
         self.drawee = drawee
@@ -13,6 +42,7 @@ class MinimalTxn():
         self.timestamp = timestamp  # generation time
         self.amount = amount - commission
         self.commission = commission
+        self._digest = None
 
     def getsize(self):
         return 1*kb
@@ -20,6 +50,20 @@ class MinimalTxn():
     def isCoinBase(self):
         return False
 
+    def serialize(self):
+        '''
+        Canonical compact byte encoding of the transaction
+        '''
+        return b'T' + encodeField(self.txnID) + encodeField(self.drawee) + encodeField(self.payee) + struct.pack('<ddd', self.timestamp, self.amount, self.commission)
+
+    def digest(self):
+        '''
+        Transaction digest (sha256 of serialization), cached
+        '''
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.serialize()).digest()
+        return self._digest
+
     def write(self):
         '''
         Prints transaction structure
@@ -27,11 +71,14 @@ class MinimalTxn():
         print(f'\tTX (id: {self.txnID}, time: {self.timestamp}, comm: {self.commission}) {self.drawee} -- [{self.amount}] --> {self.payee}')
 
 class CoinbaseTxn():
+    __slots__ = ('txnID', 'payee', 'timestamp', 'amount', '_digest')
+
     def __init__(self, txnID, payee, timestamp, amount):
         self.txnID = txnID
         self.payee = payee
         self.timestamp = timestamp  # generation time
         self.amount = amount
+        self._digest = None
 
     def getsize(self):
         return 1*kb
@@ -39,6 +86,20 @@ class CoinbaseTxn():
     def isCoinBase(self):
         return True
 
+    def serialize(self):
+        '''
+        Canonical compact byte encoding of the coinbase transaction
+        '''
+        return b'C' + encodeField(self.txnID) + encodeField(self.payee) + struct.pack('<dd', self.timestamp, self.amount)
+
+    def digest(self):
+        '''
+        Transaction digest (sha256 of serialization), cached
+        '''
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.serialize()).digest()
+        return self._digest
+
     def write(self):
         '''
         Prints coinbase transaction structure
@@ -46,24 +107,87 @@ class CoinbaseTxn():
         print(f'\tTX (id: {self.txnID}, time: {self.timestamp}) [{self.amount}] --> {self.payee}')
 
 
+class TxnTable():
+    '''
+    Columnar transaction store (numpy structured array, one row per transaction).
+    Rows are handed out as TableTxn references, which behave like MinimalTxn.
+    '''
+    dtype = np.dtype([('txnID', 'U24'), ('drawee', 'i8'), ('payee', 'i8'), ('timestamp', 'f8'), ('amount', 'f8'), ('commission', 'f8')])
+
+    def __init__(self, capacity=1024):
+        self.data = np.zeros(capacity, dtype=self.dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, txnID, drawee, payee, timestamp, amount, commission):
+        '''
+        Appends a transaction row (amount stored net of commission, as in MinimalTxn)
+        '''
+        if self.size == len(self.data):
+            self.data = np.resize(self.data, 2*len(self.data))
+        self.data[self.size] = (txnID, drawee, payee, timestamp, amount - commission, commission)
+        self.size += 1
+        return TableTxn(self, self.size - 1)
+
+    def select(self, rows):
+        '''
+        Structured sub-array of the given rows (for vectorized processing of block contents)
+        '''
+        return self.data[:self.size][rows]
+
+class TableTxn():
+    '''
+    Reference to a row of a TxnTable
+    '''
+    __slots__ = ('table', 'row', '_digest')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+        self._digest = None
+
+    txnID = property(lambda self: str(self.table.data['txnID'][self.row]))
+    drawee = property(lambda self: int(self.table.data['drawee'][self.row]))
+    payee = property(lambda self: int(self.table.data['payee'][self.row]))
+    timestamp = property(lambda self: float(self.table.data['timestamp'][self.row]))
+    amount = property(lambda self: float(self.table.data['amount'][self.row]))
+    commission = property(lambda self: float(self.table.data['commission'][self.row]))
+
+    getsize = MinimalTxn.getsize
+    isCoinBase = MinimalTxn.isCoinBase
+    serialize = MinimalTxn.serialize
+    digest = MinimalTxn.digest
+    write = MinimalTxn.write
+
+
 class MinimalBlock():
+    __slots__ = ('index', 'timestamp', 'txns', 'previous_hash', 'nonce', '_hash')
+
     def __init__(self, index, timestamp, txns, previous_hash, nonce=None):
         self.index = index
         self.timestamp = timestamp
         self.txns = txns
         self.previous_hash = previous_hash
         self.nonce = nonce
-        self.hash = self.hashing()
+        self._hash = None       # computed on first use, or when the coinbase txn is added
+
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = self.hashing()
+        return self._hash
             
     def hashing(self):
         '''
-        Computes block hash (ID, Timestamp, transactions, prev hash)
+        Computes block hash (ID, Timestamp, merkle root of transactions, prev hash)
         '''
         key = hashlib.sha256()
-        key.update(str(self.index).encode('utf-8'))
-        key.update(str(self.timestamp).encode('utf-8'))
-        key.update(str(self.txns).encode('utf-8'))
-        key.update(str(self.previous_hash).encode('utf-8'))
+        key.update(encodeField(self.index))
+        key.update(struct.pack('<d', self.timestamp))
+        key.update(merkleRoot([t.digest() for t in self.txns]))
+        key.update(encodeField(self.previous_hash))
         return key.hexdigest()
 
     def getsize(self):
@@ -78,8 +202,15 @@ class MinimalBlock():
         '''
         return sum([t.commission for t in self.txns])
 
+    def rows(self):
+        '''
+        Row indices of the table backed transactions in the block
+        '''
+        return np.array([t.row for t in self.txns if isinstance(t, TableTxn)], dtype=np.int64)
+
     def addCoinbaseTxn(self, txnID, nodeID, timestamp):
         self.txns.insert(0,CoinbaseTxn(txnID, nodeID, timestamp, self.computeCommission() + MINING_FEE))
+        self._hash = self.hashing()
 
     def write(self):
         '''
@@ -92,255 +223,374 @@ class MinimalBlock():
             pass
 
 
-# class Child():
-#     def __init__(self, hashkey, child, length=1, is_private=False):
-#         self.hashkey = hashkey
-#         self.length = length
-#         self.is_private = is_private
-#         self.child = child
+class SummaryBlock(MinimalBlock):
+    '''
+    Block of the block-only mode: only the coinbase transaction is kept, the other
+    transactions are represented by their count (which sizes the block)
+    '''
+    __slots__ = ('txn_count',)
 
-class Tree(object):
-    def __init__(self, value, childrenlist = [], genesis=False, length=1, is_private=False):
-        self.value = value          # Minimal block
-        self.length = length
-        if is_private:
-            self.length = 0
-        self.is_private = is_private
-        self.is_hidden = is_private
-        self.balances = {}
-        self.longestChild = None
-        self.children = {}
-        self.parent = None
-        maxl = -1
-
-        # Updates parent hash and max chain length for children blocks, sets the longest child as well
-        for i, child in enumerate(childrenlist):
-            hashkey = child.value.hash
-            self.children[hashkey] = child
-            self.children[hashkey].length = self.get_max_length(child)
-            # self.children[hashkey] = Child(hashkey, child, self.get_max_length(child))
-            # self.children[hashkey].parent = self
-            self.children[hashkey].parent = self
-            # self.children_len[hashkey]=self.get_max_length(child)
-            # if (self.children_len[hashkey]>maxl):
-            if (self.children[hashkey].length>maxl):
-                self.longestChild = hashkey
-
-        if (genesis):
-            for t in self.value.txns:
-                self.balances[t.payee] = t.amount
-
-
-    def add_child(self, child, path=[], is_private=False):
-        '''
-        Adds the child node to the children list 
-        Updates the longest child, balance and max chain length of child block
-        '''
-        if len(path) == 0:
-            hashkey = child.value.hash
-            self.children[hashkey] = child
-            self.children[hashkey].parent = self
-            # self.children_len[hashkey] = 1
-            # self.children[hashkey] = Child(hashkey, child, is_private=is_private)
-            # self.children[hashkey].child.parent = self
-
-            # print(self.longestChild)
-            # print(hashkey)
-            # print(self.children)
-            if not is_private:
-                if self.longestChild is None:
-                    self.longestChild = hashkey
-                elif (self.children[hashkey].length > self.children[self.longestChild].length):
-                    self.longestChild = hashkey
-
-            self.children[hashkey].update_balances()
-            # print("balance update")
-            if not is_private:
-                self.children[hashkey].update_max_lengths()
-            # print("max l update")
+    def __init__(self, index, timestamp, txn_count, previous_hash, nonce=None):
+        self.txn_count = txn_count
+        super().__init__(index, timestamp, [], previous_hash, nonce)
+
+    def hashing(self):
+        '''
+        Computes block hash (ID, Timestamp, merkle root of transactions, transaction count, prev hash)
+        '''
+        key = hashlib.sha256()
+        key.update(encodeField(self.index))
+        key.update(struct.pack('<d', self.timestamp))
+        key.update(merkleRoot([t.digest() for t in self.txns]))
+        key.update(encodeField(self.txn_count))
+        key.update(encodeField(self.previous_hash))
+        return key.hexdigest()
+
+    def getsize(self):
+        return (1+len(self.txns)+self.txn_count)*kb
+
+
+class TxnPool():
+    '''
+    Transaction pool (mempool) indexed by txnID, iterates in timestamp order.
+    Removed transactions are dropped from the ordering lazily.
+    '''
+    def __init__(self):
+        self.txns = {}          # txnID -> (timestamp, seq, txn) entry
+        self.ordered = []       # entries sorted by (timestamp, seq), may hold removed entries
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.txns)
+
+    def __contains__(self, txnID):
+        return txnID in self.txns
 
+    def __iter__(self):
+        '''
+        Iterates the transactions in timestamp order
+        '''
+        for entry in self.ordered:
+            if self.txns.get(entry[2].txnID) is entry:
+                yield entry[2]
+
+    def add(self, txn):
+        '''
+        Adds a transaction, keeping the timestamp ordering
+        '''
+        entry = (txn.timestamp, self.seq, txn)
+        self.seq += 1
+        self.txns[txn.txnID] = entry
+        if len(self.ordered) == 0 or self.ordered[-1] < entry:
+            self.ordered.append(entry)
         else:
-            try:
-                self.children[path[0]].add_child(child, path[1:], is_private)
-            except KeyError:
-                # print(path[0], self.children)
-                print("!!!!!!!! KeyError")
+            insort(self.ordered, entry)
 
-    def update_balances(self):
+    def remove(self, txnlist):
         '''
-        Uses parent block balances to update self block balances.
-        Adds coinbase amount in miner's account at the end.
+        Removes the transactions in txnlist (by txnID) from the pool
         '''
-        self.balances = self.parent.balances.copy()
-        for t in self.value.txns[1:]:
-            self.balances[t.drawee] -= t.amount
-            self.balances[t.payee] += t.amount
+        for t in txnlist:
+            self.txns.pop(t.txnID, None)
+        # compact the ordering once half of it is removed entries
+        if len(self.ordered) > 2*len(self.txns) + 16:
+            self.ordered = [entry for entry in self.ordered if self.txns.get(entry[2].txnID) is entry]
+
+class OrphanPool():
+    '''
+    Outcast (orphan) blocks whose previous block is not in the blockchain yet, indexed by the missing hash.
+    Holds at most size blocks, each for at most max_age seconds (oldest evicted first).
+    '''
+    def __init__(self, size=ORPHAN_POOL_SIZE, max_age=ORPHAN_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self.waiting = {}       # previous hash -> [(block, sent_by)]
+        self.added = {}         # block hash -> time added to the pool
+        self.queue = deque()    # (time added, block) in arrival order, may hold popped blocks
+
+    def __len__(self):
+        return len(self.added)
+
+    def add(self, block, sent_by, time):
+        '''
+        Adds an outcast block received from sent_by at time, evicts expired and overflowing blocks
+        '''
+        if block.hash in self.added:
+            return
+        self.added[block.hash] = time
+        self.waiting.setdefault(block.previous_hash, []).append((block, sent_by))
+        self.queue.append((time, block))
+
+        while self.queue and (len(self.added) > self.size or self.queue[0][0] < time - self.max_age):
+            added, block = self.queue.popleft()
+            if self.added.get(block.hash) != added:
+                continue            # already connected
+            del self.added[block.hash]
+            siblings = [x for x in self.waiting[block.previous_hash] if x[0] is not block]
+            if siblings:
+                self.waiting[block.previous_hash] = siblings
+            else:
+                del self.waiting[block.previous_hash]
 
-        t = self.value.txns[0]
-        self.balances[t.payee] += t.amount
+    def pop(self, hashkey):
+        '''
+        Removes and returns the blocks (with senders) waiting for the block hashkey
+        '''
+        children = self.waiting.pop(hashkey, [])
+        for block, _ in children:
+            del self.added[block.hash]
+        return children
+
+class SeenSet():
+    '''
+    Recently seen IDs (transaction IDs or block hashes) of a node, bounded by size: IDs are kept in two
+    generations of size/2 and the older one is dropped when the newer one fills up, so an ID is remembered
+    for at least size/2 insertions. size 0 remembers nothing.
+    '''
+    def __init__(self, size=SEEN_SIZE):
+        self.size = size
+        self.current = set()
+        self.previous = set()
+
+    def __len__(self):
+        return len(self.current) + len(self.previous)
 
-    def get_max_length(self):
+    def __contains__(self, key):
+        return key in self.current or key in self.previous
+
+    def add(self, key):
+        if not self.size:
+            return
+        self.current.add(key)
+        if 2*len(self.current) >= self.size:
+            self.previous = self.current
+            self.current = set()
+
+class BlockStore():
+    '''
+    Simulation wide block store shared by all nodes.
+    Blocks are numbered in the order they are first added to any node's blockchain,
+    each block's parent, height and balance deltas (ledger state) are stored once.
+    '''
+    def __init__(self, time, genesis_txns, checkpoint=BALANCE_CHECKPOINT):
+        self.checkpoint = checkpoint
+        self.blocks = []                # block number -> MinimalBlock
+        self.index = {}                 # block hash -> block number
+        self.parent = array('l')        # block number -> parent block number (-1 for genesis)
+        self.height = array('l')        # block number -> absolute height (genesis = 0)
+        self.children = []              # block number -> child block numbers
+        self.deltas = []                # block number -> balance changes made by the block
+        self.checkpoints = {}           # block number -> full balance sheet, every checkpoint blocks
+
+        genesis = self.get_genesis_block(time, genesis_txns)
+        self.append(genesis, -1)
+        self.checkpoints[0] = {t.payee: t.amount for t in genesis.txns}
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def get_genesis_block(self, time, genesis_txns): 
         '''
-        Returns the longest chain length starting from this block
+        Returns the genesis block
         '''
-        if (len(self.children)) == 0:
-            return 1
-        elif self.longestChild is None:
-            return 1
-        return self.children[self.longestChild].length + 1
-
-    def update_max_lengths(self):
-        '''
-        Updates the longest chain length from the block downwards
-        '''
-        maxl = -1
-        # print("updating max lengths")
-        # print((self.children[child].value.hash, self.children[child].length) for child in self.children)
-        for i, key in enumerate(self.children):
-            if not self.children[key].is_hidden:
-                self.children[key].length = self.children[key].get_max_length()
-                if (self.children[key].length>maxl):
-                    maxl = self.children[key].length
-                    self.longestChild = key
-
-        # for k in self.children:
-        #     print(self.children[k].value.index, self.children[k].length)
-        if self.parent is not None:
-            self.parent.update_max_lengths()
-
-    def get_path(self, fin_hash,  path=[]):
-        '''
-        Returns path (list of hashes) and the last block of the chain till fin_hash is encountered
-        Else returns -1,-1
-        '''
-        if (self.value.hash) == fin_hash:
-            return [], self
-        elif len(self.children) == 0:
-            return -1, -1
-        elif fin_hash in self.children:
-            return path+[fin_hash], self.children[fin_hash]
-        else:
-            for i, child in enumerate(self.children):
-                retpath, child = self.children[child].get_path(fin_hash, path+[child])
-                if retpath != -1:
-                    return retpath, child
-            return -1, -1
+        return MinimalBlock('blk_genesis', 
+                            time,
+                            genesis_txns, 
+                            '<genesis block prev hash>')
 
-    def get_timestamps(self, path, retlist=[]):
+    def append(self, block, parent):
         '''
-        Returns timestamps of blocks in the path (list of hashes)
+        Appends the block under parent (block number), returns its block number
         '''
-        if len(path) == 0:
-            return retlist + self.value.timestamp
-        else:
-            return self.children[path[0]].get_timestamps(path[1:], retlist.append(self.value.timestamp))
+        num = len(self.blocks)
+        self.blocks.append(block)
+        self.index[block.hash] = num
+        self.parent.append(parent)
+        self.height.append(0 if parent < 0 else self.height[parent] + 1)
+        self.children.append([])
+        self.deltas.append({})
+        if parent >= 0:
+            self.children[parent].append(num)
+        return num
 
-    def is_prev_pvt(self, blk):
-        fin_hash = blk.previous_hash
+    def add(self, block):
+        '''
+        Adds the block (parent must be in the store) and returns its block number.
+        Records the balance changes made by the block, adds coinbase amount in miner's account at the end.
+        Stores a full balance sheet as checkpoint every self.checkpoint blocks.
+        '''
+        num = self.index.get(block.hash)
+        if num is not None:
+            return num
+        num = self.append(block, self.index[block.previous_hash])
 
-        if (self.value.hash) == fin_hash:
-            return self.is_private
-        elif len(self.children)==0:
-            return False
-        elif fin_hash in self.children:
-            return self.children[fin_hash].is_private
-        else:
-            ret = False
-            for i, key in enumerate(self.children):
-                ret = ret or self.children[key].is_prev_pvt(blk)
-            return ret
-
-    def add_release_parallel(self, blk, hiddenHash):
-        # ret = False
-        for key in self.children:
-            if self.children[key].is_hidden:
-                self.children[key].is_hidden = False
-                self.children[key].length = 1
-                self.children[key].update_max_lengths()
-                if key==hiddenHash:
-                    return self.children[key].value, True
-                return self.children[key].value, False
-            a, b = self.children[key].add_release_parallel(blk, hiddenHash)
-            if a is not None:
-                return a, b
-
-        ########################### add check for parallel
-        return None, False
-
-    def release_pvt(self, hiddenHash):
-        blk_list = []
+        deltas = self.deltas[num]
+        for t in block.txns[1:]:
+            deltas[t.drawee] = deltas.get(t.drawee, 0) - t.amount
+            deltas[t.payee] = deltas.get(t.payee, 0) + t.amount
 
-        for key in self.children:
-            if self.children[key].is_hidden:
-                blk_list.append(self.children[key].value)
-                self.children[key].is_hidden = False
-                if self.children[key].value.hash == hiddenHash:
-                    self.children[key].length=1
-                    self.children[key].update_max_lengths()
-            a = self.children[key].release_pvt(hiddenHash)
-            blk_list.extend(a)
+        t = block.txns[0]
+        deltas[t.payee] = deltas.get(t.payee, 0) + t.amount
 
-        return blk_list
+        if self.height[num] % self.checkpoint == 0:
+            self.checkpoints[num] = self.get_balances(num)
+        return num
 
-    def write(self):
+    def get_balances(self, num):
         '''
-        Prints block and its children blocks
+        Returns the balance sheet after block num (a new dict).
+        Rebuilt from the nearest checkpoint block by applying the deltas of the blocks after it.
         '''
-        print()
-        # print(self.is_private, self.is_hidden)
-        self.value.write()
-        if len(self.children) == 0:
-            return
-        else:
-            for key in self.children:
-                self.children[key].write()
-    
+        path = []
+        while num not in self.checkpoints:
+            path.append(self.deltas[num])
+            num = self.parent[num]
+
+        balances = self.checkpoints[num].copy()
+        for deltas in reversed(path):
+            for account, delta in deltas.items():
+                balances[account] += delta
+        return balances
+
+    def get_path(self, num):
+        '''
+        Returns path (list of hashes) from the genesis block down to block num (genesis excluded)
+        '''
+        path = []
+        while self.parent[num] >= 0:
+            path.append(self.blocks[num].hash)
+            num = self.parent[num]
+        path.reverse()
+        return path
+
 class MinimalChain():
-    def __init__(self, time, genesis_txns): 
-        self.blockchainTree = Tree(self.get_genesis_block(time, genesis_txns), genesis=True)
+    '''
+    A node's view of the shared block store: which blocks it has (with insertion order),
+    private/hidden flags and the tip of its longest public chain.
+    '''
+    SEEN, PRIVATE, HIDDEN, VISIBLE = 1, 2, 4, 8     # block flags (VISIBLE: block and all ancestors public)
+
+    def __init__(self, time, genesis_txns, store=None): 
+        self.store = store if store is not None else BlockStore(time, genesis_txns)
+        self.flags = bytearray([self.SEEN | self.VISIBLE])
+        self.seq = array('l', [0])              # insertion order (fork-choice tie break)
+        self.tip = 0                            # last block of the longest public chain
+        self.hidden = []                        # hidden (unreleased private) blocks
         self.block_count = 1
         self.stick_to_private = None
         self.stick_to_private_bool = False
         self.hiddenHash = None
+        self.pendingTip = None      # tip block the pending balance sheet was built on
+        self.pendingSheet = {}      # tip balances + effects of the valid transactions in the pool
+        self.pendingValid = set()   # IDs of pool transactions valid wrt the pending balance sheet
     
-    def write(self):
+    def write(self, num=0):
         '''
-        Prints the blockchain
+        Prints the blockchain (block num and its children blocks)
         '''
-        self.blockchainTree.write()
+        print()
+        self.store.blocks[num].write()
+        for child in self.store.children[num]:
+            if self.has(child):
+                self.write(child)
 
-    def get_genesis_block(self, time, genesis_txns): 
+    def has(self, num):
         '''
-        Returns the genesis block
+        Checks if block num is in this node's blockchain
         '''
-        return MinimalBlock('blk_genesis', 
-                            time,
-                            genesis_txns, 
-                            '<genesis block prev hash>')
+        return num < len(self.flags) and self.flags[num] & self.SEEN
+
+    def get_num(self, hashkey):
+        '''
+        Returns the block number of the block with the given hash, None if not in this node's blockchain
+        '''
+        num = self.store.index.get(hashkey)
+        if num is None or not self.has(num):
+            return None
+        return num
     
     def add_block(self, block, is_private=False):
         '''
         Adds a new block to the existing tree structure
         '''
+        if self.get_num(block.hash) is not None:
+            return
         if is_private:
             # print("add blk priv", block.index, block.hash)
             self.hiddenHash = block.hash
             self.stick_to_private = block.hash
-        newchild = Tree(block, is_private=is_private)
-        path, _ = self.blockchainTree.get_path(block.previous_hash)
-        # print("path: ", path)
-        self.blockchainTree.add_child(newchild, path, is_private=is_private)
+        num = self.store.add(block)
+        if num >= len(self.flags):
+            grow = num + 1 - len(self.flags)
+            self.flags.extend(bytes(grow))
+            self.seq.extend([0]*grow)
+        self.seq[num] = self.block_count
         self.block_count += 1
 
+        if is_private:
+            self.flags[num] = self.SEEN | self.PRIVATE | self.HIDDEN
+            self.hidden.append(num)
+        else:
+            self.flags[num] = self.SEEN | (self.flags[self.store.parent[num]] & self.VISIBLE)
+            if self.flags[num] & self.VISIBLE:
+                self.update_tip(num)
+
+    def is_longer(self, num, tip):
+        '''
+        Fork choice: checks if block num should replace tip as the end of the longest chain.
+        Longer chain wins, on equal length the branch added first at the fork point wins.
+        '''
+        height, parent = self.store.height, self.store.parent
+        if height[num] != height[tip]:
+            return height[num] > height[tip]
+        while parent[num] != parent[tip]:
+            num = parent[num]
+            tip = parent[tip]
+        return self.seq[num] < self.seq[tip]
+
+    def update_tip(self, num):
+        '''
+        Updates the cached tip with a newly visible block
+        '''
+        if self.is_longer(num, self.tip):
+            self.tip = num
+
+    def reveal(self, num):
+        '''
+        Marks a hidden block as public and updates the tip with it and with
+        any public blocks already built on top of it
+        '''
+        self.flags[num] &= ~self.HIDDEN
+        if not self.flags[self.store.parent[num]] & self.VISIBLE:
+            return
+        stack = [num]
+        while stack:
+            num = stack.pop()
+            self.flags[num] |= self.VISIBLE
+            self.update_tip(num)
+            stack.extend(child for child in self.store.children[num] if self.has(child) and not self.flags[child] & self.HIDDEN)
+
+    def get_order(self, num):
+        '''
+        Returns the insertion orders of blocks from the genesis block down to block num,
+        sorting by it gives the depth first (pre-order) traversal order of the tree
+        '''
+        order = []
+        while self.store.parent[num] >= 0:
+            order.append(self.seq[num])
+            num = self.store.parent[num]
+        order.reverse()
+        return order
+
     def is_relevant(self, block):
         '''
         Checks if public chain gets altered (cummulatively) (if not, then add to public chain)
         '''
-        oldl = self.blockchainTree.get_max_length()
+        oldl = self.get_chain_size()
         # print(block.hash, block.previous_hash)
         # self.blockchainTree.write()
         self.add_block(block)
-        newl = self.blockchainTree.get_max_length()
+        newl = self.get_chain_size()
 
         return (oldl!=newl)
 
@@ -349,10 +599,14 @@ class MinimalChain():
         '''
         Returns longest chain size (exclude genesis block)
         '''
-        return self.blockchainTree.get_max_length() - 1
+        return self.store.height[self.tip]
 
     def is_prev_pvt(self, blk):
-        return self.blockchainTree.is_prev_pvt(blk)
+        '''
+        Checks if the parent block of blk is a private block
+        '''
+        parent = self.get_num(blk.previous_hash)
+        return parent is not None and bool(self.flags[parent] & self.PRIVATE)
 
     def stick_to_pvt(self):
         self.stick_to_private_bool = True
@@ -362,26 +616,24 @@ class MinimalChain():
         # a = 0
         # c = 0
 
-        public=[]
-        parent = self.blockchainTree
-        while (len(parent.children) and parent.longestChild is not None):
-            child = parent.children[parent.longestChild]
-            parent = child
-            public.append(parent.value.hash)
-        # print(public)
-        h = len(public)
+        height, parent = self.store.height, self.store.parent
+        h = height[self.tip]
 
         if self.hiddenHash is None:
             return h, h, h
-        else:
-            priv, _ = self.blockchainTree.get_path(self.hiddenHash)
-            # print(priv)
 
-        a = len(priv)
-        c = 0
-        for aa in priv:
-            if aa in public:
-                c += 1
+        # private chain length and the length of its common prefix with the public chain
+        public = self.tip
+        priv = self.get_num(self.hiddenHash)
+        a = height[priv]
+        while height[public] > height[priv]:
+            public = parent[public]
+        while height[priv] > height[public]:
+            priv = parent[priv]
+        while public != priv:
+            public = parent[public]
+            priv = parent[priv]
+        c = height[public]
 
         return h, a, c
         # depth = 0
@@ -407,13 +659,28 @@ class MinimalChain():
         # return h, depth, c
 
     def add_release_parallel(self, blk):
-        block, hidden = self.blockchainTree.add_release_parallel(blk, self.hiddenHash)
-        if hidden:
+        '''
+        Releases the first hidden private block (parallel to the public block blk)
+        '''
+        if len(self.hidden) == 0:
+            return None
+        num = min(self.hidden, key=self.get_order)
+        self.hidden.remove(num)
+        self.reveal(num)
+        block = self.store.blocks[num]
+        if block.hash == self.hiddenHash:
             self.hiddenHash = None
         return block
 
     def release_pvt(self):
-        blk_list = self.blockchainTree.release_pvt(self.hiddenHash)
+        '''
+        Releases all hidden private blocks
+        '''
+        blk_list = []
+        for num in sorted(self.hidden, key=self.get_order):
+            blk_list.append(self.store.blocks[num])
+            self.reveal(num)
+        self.hidden = []
         self.hiddenHash = None
 
         return blk_list
@@ -434,29 +701,29 @@ class MinimalChain():
         '''
 
         # prev hash valid
-        path, child = self.blockchainTree.get_path(block.previous_hash)
-        if path == -1:
+        child = self.get_num(block.previous_hash)
+        if child is None:
             if verbose:
-                print("** prev hash not found")
+                log.debug('chain', "** prev hash not found")
             return 1
 
-        if block.hash in child.children:
+        if self.get_num(block.hash) is not None:
             # if verbose:
             #     print("** same block received")
             return 2
 
-        balancesheet = child.balances.copy()
+        balancesheet = self.store.get_balances(child)
         # timestamp >= median of last 11
         timestamp_curr = block.timestamp
         timestamps_list = []
-        while (child != None) and (len(timestamps_list)<11):
-            timestamps_list.append(child.value.timestamp)
-            child = child.parent
+        while (child >= 0) and (len(timestamps_list)<11):
+            timestamps_list.append(self.store.blocks[child].timestamp)
+            child = self.store.parent[child]
 
         # timestamps_list = self.blockchainTree.get_timestamps(path)[-11:]
         if not (timestamp_curr >= median(timestamps_list)):
             if verbose:
-                print("** timestamp error")
+                log.warning('chain', "** timestamp error")
             return 2
 
         # PoW (dummy for now)
@@ -466,7 +733,7 @@ class MinimalChain():
         # check if coinbase is the last txn
         if not (block.txns[0].isCoinBase()):
             if verbose:
-                print("** first txn is not Coinbase")
+                log.warning('chain', "** first txn is not Coinbase")
             return 2
 
 
@@ -474,7 +741,7 @@ class MinimalChain():
         for t in block.txns[1:]:
             if not ((balancesheet[t.drawee]>=(t.amount+t.commission)) and (t.amount > 0) and (t.commission > 0)):
                 if verbose:
-                    print("** invalid txn, insufficient balance")
+                    log.warning('chain', "** invalid txn, insufficient balance")
                 return 2
             balancesheet[t.drawee] -= t.amount
             balancesheet[t.payee] += t.amount
@@ -484,14 +751,14 @@ class MinimalChain():
         commission = sum([t.commission for t in block.txns[1:]])
         if not ((commission + MINING_FEE) == block.txns[0].amount):
             if verbose:
-                print("** coinbase amount error")
+                log.warning('chain', "** coinbase amount error")
             return 2
 
         # amounts of all txns should be positive
         for t in block.txns[1:]:
             if not (t.amount > 0):
                 if verbose:
-                    print("** amount should be positive")
+                    log.warning('chain', "** amount should be positive")
                 return 2
         return 0
         
@@ -519,25 +786,24 @@ class MinimalChain():
         else:
             if self.hiddenHash is not None:
                 return self.hiddenHash
-            parent = self.blockchainTree
-            while (len(parent.children) and parent.longestChild is not None):
-                child = parent.children[parent.longestChild]
-                parent = child
-            # print("longest hash: ", parent.value.hash)
-            return parent.value.hash
+            return self.store.blocks[self.tip].hash
 
     def longestChainAllHashes(self):
         '''
         Returns hashes of all longest chain block IDs 
         '''
+        return self.store.get_path(self.tip)
 
-        allHashes = []
-        parent = self.blockchainTree
-        while (len(parent.children)):
-            child = parent.children[parent.longestChild]
-            allHashes.append(child.value.hash)
-            parent = child
-        return allHashes
+    def applyTxn(self, balancesheet, t):
+        '''
+        Checks if drawee has required balance to make the transaction (and amounts are positive)
+        If valid, applies the transaction to the balance sheet
+        '''
+        if not ((balancesheet[t.drawee]>=(t.amount+t.commission)) and (t.amount > 0) and (t.commission > 0)):
+            return False
+        balancesheet[t.drawee] -= t.amount
+        balancesheet[t.payee] += t.amount
+        return True
 
     def verifyTxn(self, txnlist): 
         '''
@@ -545,41 +811,72 @@ class MinimalChain():
         Checks if drawee has required balance to make the transaction
         Also maintains the coinbase transaction balance in the balance sheet
         '''
-
-        parent = self.blockchainTree
-        while (len(parent.children) and parent.longestChild is not None):
-            child = parent.children[parent.longestChild]
-            parent = child
-        balancesheet = parent.balances.copy()
+        balancesheet = self.store.get_balances(self.tip)
         # print(balancesheet)
 
         ret = []
         for t in txnlist:
             # t.write()
-            if not ((balancesheet[t.drawee]>=(t.amount+t.commission)) and (t.amount > 0) and (t.commission > 0)):
-                print("** low balance **")
-                # print(balancesheet)
-                # t.write()
+            if not self.applyTxn(balancesheet, t):
+                log.warning('chain', "** low balance **")
                 ret.append(False)
             else:
-                balancesheet[t.drawee] -= t.amount
-                balancesheet[t.payee] += t.amount
                 ret.append(True)
-        # print(parent.balances)
         return ret
 
         # also check if there is no txn in the blockchain so far with the same txnID
         ########### only in longest chain or in the whole blockchain tree ###########
 
+    def syncPending(self, txnPool):
+        '''
+        Rebuilds the pending balance sheet (tip balances + transaction pool effects)
+        if the tip changed or the pool was reset since it was built
+        txnPool is a TxnPool (iterates in timestamp order)
+        '''
+        if self.pendingTip == self.tip:
+            return
+        self.pendingTip = self.tip
+        self.pendingSheet = self.store.get_balances(self.tip)
+        self.pendingValid = set()
+        for t in txnPool:
+            if self.applyTxn(self.pendingSheet, t):
+                self.pendingValid.add(t.txnID)
+
+    def resetPending(self):
+        '''
+        Marks the pending balance sheet stale (transactions removed from the pool)
+        '''
+        self.pendingTip = None
+
+    def verifyPendingTxn(self, txn, txnPool):
+        '''
+        Verifies a new transaction against the longest chain balances and the transaction pool,
+        txnPool must not contain txn. If valid, its effect is added to the pending balance sheet.
+        '''
+        self.syncPending(txnPool)
+        if not self.applyTxn(self.pendingSheet, txn):
+            log.warning('chain', "** low balance **")
+            return False
+        self.pendingValid.add(txn.txnID)
+        return True
+
+    def legitTxns(self, txnPool):
+        '''
+        Yields the valid transactions of the pool (wrt the longest chain) in timestamp order
+        '''
+        self.syncPending(txnPool)
+        for t in txnPool:
+            if t.txnID in self.pendingValid:
+                yield t
+
     def longestChainMiners(self):
         '''
         Returns list of miner node IDs in the longest chain
         '''
-
         miners = []
-        parent = self.blockchainTree
-        while (len(parent.children) and parent.longestChild is not None):
-            child = parent.children[parent.longestChild]
-            parent = child
-            miners.append(child.value.txns[0].payee)
+        num = self.tip
+        while self.store.parent[num] >= 0:
+            miners.append(self.store.blocks[num].txns[0].payee)
+            num = self.store.parent[num]
+        miners.reverse()
         return miners
\ No newline at end of file
@@ -7,22 +7,32 @@ kb = 1000
 mb = 10^6
 MINING_FEE = 5
 eps = 1e-8
+BALANCE_CHECKPOINT = 32    # full balance sheet stored every 32 blocks (deltas in between)
 
 ######################################################
 
 # NETWORK PARAMS
 LATENCY_C = [100000, 5000]
 LATENCY_D_MEAN = [96/LATENCY_C[0], 96/LATENCY_C[1]]
-LATENCY_RHO = np.random.uniform(0.01,0.5)
+LATENCY_RHO_RANGE = (0.01, 0.5)  # rho sampled uniformly per link
+LATENCY_BLOCK = 256     # queueing delays pre-sampled per link at a time
 
 ######################################################
 
-# MAINFILE PARAMS
+# MAINFILE PARAMS (defaults of simulation.SimulationConfig)
 # SEED = 9
 
 # sim config
 starttime = 0
 endtime = 25000
+KERNEL = 'simpy'    # event kernel: simpy or heap
+LOG_LEVEL = 'info'  # debug prints every send/receive/mining event
+LOG_CATEGORIES = None   # comma separated subset of net,mine,chain,txn (None for all)
+LOG_RING = 0        # keep the last K events in memory, dumped if the simulation crashes
+RESULTS_DIR = "../results"  # plots, block logs and trace
+CHECKPOINT_EVERY = None     # simulation seconds between snapshots (heap kernel only)
+PROFILE = False             # count and time the hot functions per node type
+PROFILE_EVERY = None        # simulation seconds between profile dumps (None: only at the end)
 
 # network config
 N = 100 # var
@@ -32,23 +42,26 @@ SELFISH = False
 STUBBORN = False
 ADV_HASH_POWER = 0.7
 ADV_GAMMA = 0.5
-nodeIDs = []
-conn = {}
-node_map = {}
-freeze_time = endtime - 50
-log_endtime = endtime - 1
 
 # txn config
-TxnID = 0
 commission_rate = 0.01
 TXN_EXP_DIST_MEAN = 10 # var
-DISCRETIZER = TXN_EXP_DIST_MEAN/2
 INIT_BALANCE = 1000000
+TXN_TABLE = False   # store generated transactions in a columnar TxnTable
+BLOCKS_ONLY = False # model transactions in aggregate (block sizes from the rate), for attack studies
 
 ######################################################
 
 # NODE PARAMS
 TXN_WINDOW = 0
 MINE_DELAY_MEAN = 300 # var
+MINING = 'node'     # node: a mining timer per node, race: one superposed mining race event
+MINING_MODES = ['node', 'race']
+ORPHAN_POOL_SIZE = 1000     # max outcast blocks waiting for their previous block
+ORPHAN_MAX_AGE = 5000       # seconds an outcast block may wait
+SEEN_SIZE = 4096            # txn/block IDs remembered per node for gossip dedup (0: no seen-sets)
+RELAY = 'push'              # push: send payloads to every peer, inv: announce IDs, peers fetch what they have not seen
+RELAY_MODES = ['push', 'inv']
+INV_SIZE = 0.04*kb          # size of an announcement or request (one inventory entry)
 
 ######################################################
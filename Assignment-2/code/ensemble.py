@@ -0,0 +1,177 @@
+'''
+Monte Carlo ensembles: runs one configuration over many seeds in parallel, streaming each run's metrics
+into online mean/variance accumulators, and stops once the confidence interval of the target metric
+(MPU_adv by default) is narrower than the requested width.
+'''
+import argparse
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from sweep import MODES, config_hash, run_point, load_point
+from constants import *
+
+METRICS = ['MPU_adv', 'MPU_overall', 'adv_fraction', 'chain_length']
+ADV_METRICS = ['MPU_adv', 'adv_fraction']		# only reported with an adversary
+
+def betainc(a, b, x):
+	'''
+	Regularized incomplete beta function I_x(a, b) (continued fraction, Numerical Recipes betacf)
+	'''
+	if x <= 0 or x >= 1:
+		return 0.0 if x <= 0 else 1.0
+	if x > (a + 1)/(a + b + 2):
+		return 1 - betainc(b, a, 1 - x)
+	front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a*math.log(x) + b*math.log(1 - x))/a
+	tiny = 1e-300
+	c, d = 1.0, 1 - (a + b)*x/(a + 1)
+	d = 1/(d if abs(d) > tiny else tiny)
+	f = d
+	for m in range(1, 300):
+		for num in (m*(b - m)*x/((a + 2*m - 1)*(a + 2*m)), -(a + m)*(a + b + m)*x/((a + 2*m)*(a + 2*m + 1))):
+			d = 1 + num*d
+			d = 1/(d if abs(d) > tiny else tiny)
+			c = 1 + num/c
+			c = c if abs(c) > tiny else tiny
+			f *= c*d
+		if abs(c*d - 1) < 1e-15:
+			break
+	return front*f
+
+def t_quantile(p, df):
+	'''
+	Quantile of the Student t distribution with df degrees of freedom (p > 1/2), by bisection of its cdf
+	'''
+	def cdf(t):
+		return 1 - 0.5*betainc(df/2, 0.5, df/(df + t*t))
+	lo, hi = 0.0, 1.0
+	while cdf(hi) < p:
+		hi *= 2
+	for _ in range(100):
+		mid = (lo + hi)/2
+		lo, hi = (mid, hi) if cdf(mid) < p else (lo, mid)
+	return (lo + hi)/2
+
+class RunningStats():
+	'''
+	Welford's online mean and variance
+	'''
+	def __init__(self):
+		self.n = 0
+		self.mean = 0.0
+		self.m2 = 0.0
+
+	def add(self, x):
+		self.n += 1
+		delta = x - self.mean
+		self.mean += delta/self.n
+		self.m2 += delta*(x - self.mean)
+
+	def variance(self):
+		return self.m2/(self.n - 1) if self.n > 1 else float('inf')
+
+	def ci_width(self, confidence=0.95):
+		'''
+		Width of the Student t confidence interval of the mean (n - 1 degrees of freedom)
+		'''
+		if self.n < 2:
+			return float('inf')
+		t = t_quantile((1 + confidence)/2, self.n - 1)
+		return 2*t*math.sqrt(self.variance()/self.n)
+
+	def summary(self, confidence=0.95):
+		return {'n': self.n, 'mean': self.mean, 'std': math.sqrt(self.variance()) if self.n > 1 else None, 'ci_width': self.ci_width(confidence) if self.n > 1 else None}
+
+def ensemble(point, seeds, ensemble_dir, metric, target, min_runs=5, confidence=0.95, workers=None):
+	'''
+	Runs the point for the seeds (in order, cached runs reused) until the confidence interval of metric
+	is narrower than target (after at least min_runs runs). Returns the accumulators by metric.
+	'''
+	if point['mode'] == 'honest' and metric in ADV_METRICS:
+		raise ValueError("metric {} needs an adversary, not reported in honest mode (use MPU_overall or chain_length)".format(metric))
+	stats = {m: RunningStats() for m in METRICS}
+	seeds = iter(seeds)
+	workers = workers or os.cpu_count()
+	os.makedirs(ensemble_dir, exist_ok=True)
+
+	def converged():
+		return stats[metric].n >= min_runs and stats[metric].ci_width(confidence) < target
+
+	def add(summary):
+		for m in METRICS:
+			if summary.get(m) is not None:
+				stats[m].add(summary[m])
+		print("run {}: {} = {:.4f}, mean {:.4f}, ci width {:.4f}".format(stats[metric].n, metric, summary[metric], stats[metric].mean, stats[metric].ci_width(confidence)))
+
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		running = {}
+		while not converged():
+			# keep the pool busy, cached seeds are added directly
+			while len(running) < workers and not converged():
+				seed = next(seeds, None)
+				if seed is None:
+					break
+				seed_point = dict(point, seed=seed)
+				seed_dir = os.path.join(ensemble_dir, 'points', config_hash(seed_point))
+				summary = load_point(seed_dir)
+				if summary is not None:
+					add(summary)
+				else:
+					running[pool.submit(run_point, seed_point, seed_dir)] = seed
+			if not running:
+				break
+			done, _ = wait(running, return_when=FIRST_COMPLETED)
+			for future in done:
+				seed = running.pop(future)
+				try:
+					add(future.result())
+				except Exception as e:
+					print("failed: seed {} ({!r})".format(seed, e))
+		# runs already started are kept
+		for future in running:
+			try:
+				add(future.result())
+			except Exception:
+				pass
+	return stats
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Multi-seed ensemble with early stopping on the confidence interval')
+	parser.add_argument('-name', metavar='NAME', type=str, required=True, help='ensemble name (output in <dir>/<name>)')
+	parser.add_argument('-dir', metavar='D', type=str, default='../ensembles', help='directory holding the ensembles')
+	parser.add_argument('-n', metavar='N', type=int, default=N, help='Number of Peers in the network (> 1)')
+	parser.add_argument('-fast', metavar='Z', type=float, default=FAST_RATIO, help='fast peer ratio')
+	parser.add_argument('-mine', metavar='MD', type=float, default=MINE_DELAY_MEAN, help='mean mining delay')
+	parser.add_argument('-txn', metavar='TD', type=float, default=TXN_EXP_DIST_MEAN, help='mean transaction delay')
+	parser.add_argument('-mode', metavar='M', type=str, default='selfish', choices=list(MODES.keys()), help='adversary mode')
+	parser.add_argument('-endtime', metavar='T', type=float, default=endtime, help='simulation end time (seconds)')
+	parser.add_argument('-seed', metavar='S', type=int, default=SEED, help='first seed (runs use seed, seed+1, ...)')
+	parser.add_argument('-runs', metavar='R', type=int, default=100, help='maximum number of runs')
+	parser.add_argument('-minruns', metavar='MR', type=int, default=5, help='minimum number of runs')
+	parser.add_argument('-metric', metavar='MT', type=str, default=None, choices=METRICS, help='metric to converge (MPU_adv, or MPU_overall for honest runs)')
+	parser.add_argument('-ci', metavar='W', type=float, default=0.02, help='target confidence interval width')
+	parser.add_argument('-conf', metavar='C', type=float, default=0.95, help='confidence level')
+	parser.add_argument('-blocksonly', metavar='BO', type=bool, default=BLOCKS_ONLY, help='block-only mode (transactions in aggregate, much faster attack runs)')
+	parser.add_argument('-workers', metavar='W', type=int, default=None, help='worker processes (default: all cores)')
+	args = parser.parse_args()
+
+	metric = args.metric or ('MPU_overall' if args.mode == 'honest' else 'MPU_adv')
+	if args.mode == 'honest' and metric in ADV_METRICS:
+		parser.error("-metric {} needs an adversary, not reported in honest mode (use MPU_overall or chain_length)".format(metric))
+	point = {'n': args.n, 'fast': float(args.fast), 'mine': float(args.mine), 'txn': float(args.txn), 'mode': args.mode, 'endtime': float(args.endtime)}
+	if args.blocksonly:
+		point['blocks_only'] = True
+	ensemble_dir = os.path.abspath(os.path.join(args.dir, args.name))
+	stats = ensemble(point, range(args.seed, args.seed + args.runs), ensemble_dir, metric, args.ci, args.minruns, args.conf, args.workers)
+
+	result = {'config': point, 'metric': metric, 'target_ci_width': args.ci, 'confidence': args.conf,
+		'converged': stats[metric].n >= args.minruns and stats[metric].ci_width(args.conf) < args.ci,
+		'stats': {m: stats[m].summary(args.conf) for m in METRICS if stats[m].n > 0}}
+	with open(os.path.join(ensemble_dir, 'ensemble.json'), 'w') as f:
+		json.dump(result, f, indent=1)
+	print("------------------------")
+	for m, s in result['stats'].items():
+		print("{:<14} n {:<4} mean {:.4f} ci width {}".format(m, s['n'], s['mean'], "{:.4f}".format(s['ci_width']) if s['ci_width'] is not None else '-'))
+	print("converged" if result['converged'] else "not converged (max runs reached)")
@@ -0,0 +1,117 @@
+'''
+Event kernels for the simulation. Both implement the scheduler interface used by the nodes:
+	now: current simulation time
+	schedule(delay, callback, *args): run callback(*args) after delay, returns a handle for cancel
+	defer(callback, *args): run callback(*args) now, before the timed events due now (like a process start)
+	cancel(handle): drop a scheduled callback that has not run yet
+	run(until): process events up to (excluding) time until
+'''
+import heapq
+import simpy
+from simpy.events import Event, URGENT, NORMAL
+
+
+class HeapKernel():
+	'''
+	Purpose built kernel, binary heap of [time, priority, seq, callback, args] entries.
+	Cancelled entries get callback None and are removed once they are half of the heap.
+	'''
+	def __init__(self, initial_time=0):
+		self.now = initial_time
+		self.queue = []
+		self.seq = 0
+		self.events = 0			# callbacks processed
+		self.cancelled = 0		# cancelled entries still in the heap
+
+	def schedule(self, delay, callback, *args):
+		self.seq += 1
+		entry = [self.now + delay, NORMAL, self.seq, callback, args]
+		heapq.heappush(self.queue, entry)
+		return entry
+
+	def defer(self, callback, *args):
+		self.seq += 1
+		entry = [self.now, URGENT, self.seq, callback, args]
+		heapq.heappush(self.queue, entry)
+		return entry
+
+	def cancel(self, entry):
+		if entry[3] is None:
+			return			# already run or cancelled
+		entry[3] = None
+		entry[4] = None
+		self.cancelled += 1
+		if self.cancelled > 64 and 2*self.cancelled > len(self.queue):
+			# in place, run() holds a reference to the queue
+			self.queue[:] = [e for e in self.queue if e[3] is not None]
+			heapq.heapify(self.queue)
+			self.cancelled = 0
+
+	def run(self, until):
+		queue = self.queue
+		pop = heapq.heappop
+		while queue and queue[0][0] < until:
+			entry = pop(queue)
+			callback = entry[3]
+			if callback is None:
+				self.cancelled -= 1
+				continue
+			entry[3] = None			# run, cancel is a no-op from now on
+			self.now = entry[0]
+			self.events += 1
+			callback(*entry[4])
+		self.now = until
+
+
+class Dispatch(Event):
+	'''
+	SimPy event running a callback, urgent ones are scheduled like the start of a process
+	'''
+	def __init__(self, kernel, delay, priority, callback, args):
+		self.env = kernel.env
+		self.kernel = kernel
+		self.callback = callback
+		self.args = args
+		self.callbacks = [self.dispatch]
+		self._value = None
+		self._ok = True
+		self.env.schedule(self, priority, delay)
+
+	def dispatch(self, event):
+		if self.callback is not None:
+			self.kernel.fire(self.callback, self.args)
+
+
+class SimpyKernel():
+	'''
+	Scheduler interface on top of simpy.Environment
+	'''
+	def __init__(self, initial_time=0):
+		self.env = simpy.Environment(initial_time)
+		self.events = 0			# callbacks processed
+
+	@property
+	def now(self):
+		return self.env.now
+
+	def fire(self, callback, args):
+		self.events += 1
+		callback(*args)
+
+	def schedule(self, delay, callback, *args):
+		return Dispatch(self, delay, NORMAL, callback, args)
+
+	def defer(self, callback, *args):
+		return Dispatch(self, 0, URGENT, callback, args)
+
+	def cancel(self, dispatch):
+		'''
+		SimPy can not remove a scheduled event, it stays queued and does nothing
+		'''
+		dispatch.callback = None
+
+	def run(self, until):
+		self.env.run(until = until)
+
+
+KERNELS = {'simpy': SimpyKernel, 'heap': HeapKernel}
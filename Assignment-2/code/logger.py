@@ -0,0 +1,71 @@
+import sys
+from collections import deque
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+OFF = ERROR + 10
+
+class EventLog():
+	'''
+	Leveled simulation logger with category filters.
+	Messages are str.format templates, formatted only when the event is written.
+	Optionally keeps the last K events (unformatted) in a ring buffer, dumped on crashes.
+	'''
+	def __init__(self, level=INFO, categories=None, ring=0, ring_level=DEBUG, stream=None):
+		self.configure(level, categories, ring, ring_level, stream)
+
+	def configure(self, level=INFO, categories=None, ring=0, ring_level=DEBUG, stream=None):
+		'''
+		categories: None for all, else the categories written to the stream
+		ring: size of the ring buffer (0 to disable), which records events at ring_level and above
+		'''
+		self.level = level
+		self.categories = set(categories) if categories is not None else None
+		self.ring = deque(maxlen=ring) if ring > 0 else None
+		self.ring_level = ring_level if ring > 0 else OFF
+		self.stream = stream
+		self.threshold = min(self.level, self.ring_level)		# below this nothing is done at all
+
+	def enabled(self, level, category):
+		'''
+		True if an event would be written or recorded (use to guard costly arguments)
+		'''
+		if level < self.threshold:
+			return False
+		return level >= self.ring_level or (level >= self.level and (self.categories is None or category in self.categories))
+
+	def log(self, level, category, msg, *args):
+		if level < self.threshold:
+			return
+		if self.ring is not None and level >= self.ring_level:
+			self.ring.append((level, category, msg, args))
+		if level >= self.level and (self.categories is None or category in self.categories):
+			(self.stream or sys.stdout).write((msg.format(*args) if args else msg) + '\n')
+
+	def debug(self, category, msg, *args):
+		if DEBUG >= self.threshold:
+			self.log(DEBUG, category, msg, *args)
+
+	def info(self, category, msg, *args):
+		self.log(INFO, category, msg, *args)
+
+	def warning(self, category, msg, *args):
+		self.log(WARNING, category, msg, *args)
+
+	def error(self, category, msg, *args):
+		self.log(ERROR, category, msg, *args)
+
+	def dump(self, stream=None):
+		'''
+		Writes the events in the ring buffer (oldest first)
+		'''
+		if self.ring is None:
+			return
+		stream = stream or sys.stderr
+		stream.write('------------------------\nlast {} events\n'.format(len(self.ring)))
+		for level, category, msg, args in self.ring:
+			stream.write('[{}:{}] {}\n'.format(category, level, (msg.format(*args) if args else msg).strip('\n')))
+
+
+# shared simulation log, configured in main.py
+log = EventLog()
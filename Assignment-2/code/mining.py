@@ -0,0 +1,107 @@
+'''
+Mining schedulers.
+MiningJob: the mining timer of a node, cancelled in the kernel when the block is interrupted.
+MiningRace: instead of one exponential timer per mining node, a single pending event samples the first
+block of all miners together, with the total mining rate, and the winner is picked in proportion to hash power.
+'''
+from logger import log
+from constants import *
+
+class MiningJob():
+	'''
+	Pending minedBlock event of a node, at most one: starting a block replaces the previous event,
+	an interrupt cancels it instead of leaving it queued until it fires
+	'''
+	def __init__(self, node):
+		self.node = node
+		self.event = None			# kernel handle of the pending event
+		self.blkID = None
+		self.sleeptime = None		# time the block was started
+
+	def start(self, delay, blkID, sleeptime):
+		self.cancel()
+		self.blkID = blkID
+		self.sleeptime = sleeptime
+		self.event = self.node.env.schedule(delay, self.fire)
+
+	def cancel(self):
+		if self.event is not None:
+			self.node.env.cancel(self.event)
+			self.event = None
+
+	def interrupt(self):
+		'''
+		Cancels the pending event if minedBlock would discard it (interrupted after the block was started)
+		'''
+		if self.event is not None and self.node.env.now > self.sleeptime:
+			self.cancel()
+
+	def fire(self):
+		self.event = None
+		self.node.minedBlock(self.blkID, self.sleeptime)
+
+class MiningRace():
+	'''
+	Miners are the nodes that started mining since they were last found idle. The race samples the
+	next event with their total rate, the picked node mines its current potential block if it is still
+	mining, otherwise it is dropped from the race (thinning, exact as the mining times are exponential).
+	Restarting a job needs no resampling, only a node joining the race does.
+	'''
+	def __init__(self, env, rng, mine_delay_mean):
+		self.env = env
+		self.rng = rng
+		self.mine_delay_mean = mine_delay_mean	# mean block delay for all the hash power
+		self.miners = {}			# nodeID -> node, in order of joining
+		self.power = 0.0			# total hash power of the miners
+		self.event = None			# kernel handle of the pending race event
+		self.pending = False		# resample scheduled for the current instant
+		self.races = 0				# race events fired (blocks and idle nodes picked)
+
+	@staticmethod
+	def is_mining(node):
+		'''
+		True if the node's potential block is being mined (not interrupted or mined since it was started)
+		'''
+		return node.potentialBlock is not None and not (node.interrupt_time > node.start_mine) and not (node.end_mine > node.start_mine)
+
+	def start(self, node):
+		'''
+		Called when node starts mining its potential block
+		'''
+		if node.nodeID not in self.miners:
+			self.miners[node.nodeID] = node
+			self.power += node.hash_power
+			if not self.pending:
+				# resampled once all the nodes joining in this instant have joined
+				self.pending = True
+				self.env.schedule(0, self.resample)
+
+	def resample(self):
+		self.pending = False
+		if self.event is not None:
+			self.env.cancel(self.event)
+			self.event = None
+		if self.miners:
+			self.event = self.env.schedule(self.rng.exponential(self.mine_delay_mean / self.power), self.fire)
+
+	def fire(self):
+		'''
+		Next block of the superposed race: picks a miner in proportion to hash power
+		'''
+		self.event = None
+		self.races += 1
+		self.power = sum(node.hash_power for node in self.miners.values())
+		target = self.rng.uniform() * self.power
+		for node in self.miners.values():
+			target -= node.hash_power
+			if target < 0:
+				break
+		if self.is_mining(node):
+			log.debug('mine', "{:.2f}: race won by {}", self.env.now, node.nodeID)
+			node.minedBlock(node.potentialBlock.index, node.start_mine)
+		else:
+			# idle since its last block or interrupt, joins again when it restarts mining
+			del self.miners[node.nodeID]
+			self.power -= node.hash_power
+		if not self.pending:
+			self.resample()
@@ -1,63 +1,93 @@
+import os
 import numpy as np
 import networkx
 from constants import *
 from visualise import *
 
-np.random.seed(SEED)
-
-def nodes_generator(n, honest_n, fast_percent):
+def nodes_generator(config, rng):
 	'''
-	Samples fast nodes uniformly and graph based on powerlaw distribution
-	Returns list of node IDs along with fast nodes and graph connections 
+	Samples fast nodes uniformly and graph based on powerlaw distribution (config: simulation.SimulationConfig, rng: its random state)
+	Returns list of node IDs along with fast nodes and the network (graph connections and link latencies)
 	'''
-	fast_indices = np.random.choice(honest_n, int(honest_n*fast_percent), replace=False)
+	n, honest_n = config.n, config.honest_n
+	fast_indices = rng.choice(honest_n, int(honest_n*config.fast_ratio), replace=False)
 	fast_nodes = np.append(np.zeros(n).astype(bool), [True]*(n - honest_n))
 	fast_nodes[fast_indices] = 1
-	conn = powerlaw_distributed_graph(n, honest_n, fast_nodes)
-	nodeIDs = list(conn.keys())
-	return nodeIDs, conn, fast_nodes
+	network = powerlaw_distributed_graph(config, fast_nodes, rng)
+	nodeIDs = list(range(n))
+	return nodeIDs, network, fast_nodes
 
-def compute_latency(message_length, both_fast = False):
+class Network():
 	'''
-	Computes latency = rho_ij + m/C_ij + D_ij 
+	Peer graph in CSR form: the links (edges) of node i are indptr[i] <= e < indptr[i+1], leading to peer indices[e].
+	Per link latency parameters (rho, C, D mean) are arrays indexed by edge.
+	Queueing delays are pre-sampled in blocks per link and handed out one at a time.
 	'''
+	def __init__(self, adjacency, fast_nodes, seed=SEED, block=LATENCY_BLOCK):
+		n = len(adjacency)
+		self.fast_nodes = np.asarray(fast_nodes, dtype=bool)
+		self.indptr = np.zeros(n+1, dtype=np.int64)
+		self.indptr[1:] = np.cumsum([len(adjacency[i]) for i in range(n)])
+		self.indices = np.array([j for i in range(n) for j in adjacency[i]], dtype=np.int64)
+		src = np.repeat(np.arange(n), np.diff(self.indptr))
+		self.fast = self.fast_nodes[src] & self.fast_nodes[self.indices]		# both ends fast
 
-	C, D_MEAN = (LATENCY_C[0], LATENCY_D_MEAN[0]) if both_fast else (LATENCY_C[1], LATENCY_D_MEAN[1])
-	return LATENCY_RHO + message_length/C + np.random.exponential(D_MEAN)
+		self.rng = np.random.default_rng(seed)
+		link_rho = {}		# one rho per link, same in both directions
+		self.rho = np.array([link_rho.setdefault((min(i, j), max(i, j)), self.rng.uniform(*LATENCY_RHO_RANGE)) for i, j in zip(src.tolist(), self.indices.tolist())])
+		self.C = np.where(self.fast, LATENCY_C[0], LATENCY_C[1]).astype(float)
+		self.D_MEAN = np.where(self.fast, LATENCY_D_MEAN[0], LATENCY_D_MEAN[1])
+		self.block = block
+		self.samples = [[] for _ in range(len(self.indices))]		# remaining pre-sampled queueing delays per edge
 
+		# plain lists for per message lookups
+		self.rho_list = self.rho.tolist()
+		self.C_list = self.C.tolist()
 
-def are_fast(i,j, fast_nodes):
-	'''
-	Returns True if both nodes i and j are fast else False
-	'''
-	return (fast_nodes[i] and fast_nodes[j])
+	def __repr__(self):
+		return str({i: {j: bool(self.fast[e]) for e, j in zip(self.edges(i), self.neighbours(i))} for i in range(len(self.indptr)-1)})
+
+	def neighbours(self, i):
+		return self.indices[self.indptr[i]:self.indptr[i+1]].tolist()
 
-def powerlaw_distributed_graph(n, honest_n, fast_nodes, m=2, p=0.46, seed=SEED):
+	def edges(self, i):
+		return range(int(self.indptr[i]), int(self.indptr[i+1]))
+
+	def queueing_delay(self, e):
+		'''
+		Next exponential queueing delay of edge e, refilling its block when used up
+		'''
+		samples = self.samples[e]
+		if not samples:
+			samples.extend((self.D_MEAN[e] * self.rng.standard_exponential(self.block)).tolist())
+		return samples.pop()
+
+	def latency(self, e, message_length):
+		'''
+		Computes latency = rho_ij + m/C_ij + D_ij for edge e
+		'''
+		return self.rho_list[e] + message_length/self.C_list[e] + self.queueing_delay(e)
+
+def powerlaw_distributed_graph(config, fast_nodes, rng, m=2, p=0.46):
 	'''
 	Generates a graph based on powerlaw degree distribution
 	Ref: https://networkx.org/documentation/stable/reference/generated/networkx.generators.random_graphs.powerlaw_cluster_graph.html
 	'''
 
-	conn1 = networkx.powerlaw_cluster_graph(honest_n, m, p, seed)
+	n, honest_n = config.n, config.honest_n
+	conn1 = networkx.powerlaw_cluster_graph(honest_n, m, p, config.graph_seed)
 	if n==2:
 		conn1.add_edges_from([(0, 1)])
 	# print_graph(conn1)
-	conn = {}
 	for i in range(n - honest_n):
-		adj_list = np.random.choice(honest_n, max(int(ADV_GAMMA*honest_n), 1), replace=False)
+		adj_list = rng.choice(honest_n, max(int(config.adv_gamma*honest_n), 1), replace=False)
 		for adj in adj_list:
 			conn1.add_edges_from([(honest_n + i, adj)])
 
 	colors = ['green' if fast_nodes[i] else 'blue' for i in range(honest_n)] + ['red']*(n - honest_n)
-	print_graph(conn1, colors)
-
-	conn = {}
-	for n1 in conn1:
-		conn[n1] = {}
-		for n2 in conn1[n1]:
-			conn[n1][n2] = are_fast(n1, n2, fast_nodes)
+	print_graph(conn1, colors, os.path.join(config.results_dir, "network"), rng)
 
-	return conn
+	return Network({n1: list(conn1[n1]) for n1 in conn1}, fast_nodes, config.seed, config.latency_block)
 
 # def regular_graph(d, n, fast_nodes=None):
 # 	'''
@@ -1,56 +1,71 @@
 import numpy as np 
-from chain import MinimalTxn, MinimalBlock, MinimalChain
-from network import compute_latency
+from collections import deque
+from itertools import islice
+from chain import MinimalTxn, MinimalBlock, SummaryBlock, MinimalChain, TxnPool, OrphanPool, SeenSet
+from mining import MiningJob
 from constants import *
-
-np.random.seed(SEED)
+from logger import log
 
 class Node():
-	def __init__(self, env, call, nodeID, genesis_txns, peers = {}, is_fast=False, hash_power = 0.1):
-		self.env = env
-		self.call = call
+	def __init__(self, sim, nodeID, genesis_txns, is_fast=False, hash_power = 0.1, store = None, trace = None):
+		self.sim = sim				# simulation.Simulation the node belongs to
+		self.config = sim.config
+		self.env = sim.env
+		self.call = sim.call
+		self.rng = sim.rng
+		self.race = sim.race		# mining.MiningRace if the simulation races all miners in one event
 		self.nodeID = nodeID
-		self.peers = peers
+		network = sim.network
+		self.network = network
+		self.peers = network.neighbours(nodeID) if network is not None else []
+		self.edges = network.edges(nodeID) if network is not None else []
 		self.is_fast = is_fast
 		self.hash_power = hash_power
-		self.txnPool = []
-		self.legitTxnPool = []
-		self.blockchain = MinimalChain(0, genesis_txns)
+		self.blocks_only = self.config.blocks_only		# mine without transactions (block sizes from the txn rate)
+		self.txnPool = TxnPool()
+		self.blockchain = MinimalChain(0, genesis_txns, store)
 		self.potentialBlock = None
-		self.outcastBlocks = []
+		self.outcastBlocks = OrphanPool(self.config.orphan_pool_size, self.config.orphan_max_age)
+		self.seenTxns = SeenSet(self.config.seen_size)		# txns added to the pool or mined, late copies are dropped
+		self.seenBlocks = SeenSet(self.config.seen_size)	# blocks accepted or rejected (not outcasts)
+		self.relay = self.config.relay		# 'push' payloads to the peers or announce them ('inv') for the peers to fetch
+		self.requested = set()		# IDs fetched and not received yet (inv relay)
+		self.edge_of = dict(zip(self.peers, self.edges))
 		self.start_mine = -1		# mining start time for the latest potential block
 		self.end_mine = -1
 		self.interrupt_time = -1
+		self.generate_pending = False	# generateBlock deferred but not run yet
+		self.job = MiningJob(self)		# pending minedBlock event (per node mining)
 		self.blocks_received = 0
 		self.blocks_mined = 0
-		self.logs = []
+		self.trace = trace			# block arrival trace (blocktrace.TraceWriter)
+		self.links = None		# peer -> bound receiver (announce with inv relay), set by link()
+
+	def link(self, node_map):
+		'''
+		Bind the receivers (or announcement handlers) of the peers for direct (callback based) delivery
+		'''
+		handler = 'announce' if self.relay == 'inv' else 'receiver'
+		self.links = [getattr(node_map[peer], handler) for peer in self.peers]
 
 	def addToBlockchain(self, block, sent_by):
 		'''
-		Update log list and add block to blockchain
+		Record block arrival in the trace and add block to blockchain
 		'''
 		if sent_by == None:
 			sent_by = self.nodeID
 		self.blocks_received += 1
-		self.logs.append(",".join([block.hash, str(self.blocks_received), str("{:.2f}".format(self.env.now)), block.previous_hash, str(block.txns[0].payee)])+'\n')
+		if self.trace is not None:
+			self.trace.write(self.nodeID, block, self.env.now)
 		self.blockchain.add_block(block)
 
 		self.broadcast(block, 1, sent_by)
 
-	def removeTxn(self, txnlist1, txnlist2):
-		'''
-		Remove by txnID, return txnlist1 - txlist2
-		'''
-
-		rmTxnIDs = [t.txnID for t in txnlist2]
-		txnlist1 = [t for t in txnlist1 if t.txnID not in rmTxnIDs]
-		return txnlist1
-
 	def get_miner_info(self):
 		'''
 		Useful for plotting graphs and generating log files
 		'''
-		return [self.blocks_mined, self.is_fast, self.hash_power, self.logs]
+		return [self.blocks_mined, self.is_fast, self.hash_power]
 
 	def get_blockchain(self):
 		return self.blockchain
@@ -60,34 +75,54 @@ class Node():
 		Verify transaction with the longest chain, add to transaction pool, broadcast and start mining.
 		Print error msg if invalid.
 		'''
-		if self.blockchain.verifyTxn(sorted(self.txnPool + [txn], key = lambda x: x.timestamp))[0]:
+		if self.blockchain.verifyPendingTxn(txn, self.txnPool):
 			# print("\n{:.2f}: txn {} generated at {}".format(self.env.now, txn.txnID, self.nodeID))
-			self.txnPool.append(txn)		
+			self.txnPool.add(txn)
+			self.seenTxns.add(txn.txnID)
 			self.broadcast(txn, 0, self.nodeID)
 			# print("start_mining at gen_txn")
 			self.start_mining()
 		else:
-			print("\nInvalid Transaction attempted")
+			log.warning('txn', "\nInvalid Transaction attempted")
 
 	def broadcast(self, data, dtype, sent_by):
 		'''
 		Scan through peers and send to everyone except the sender (sent_by).
 		'''
+		# latencies are drawn at the same point as with one SimPy process per peer
+		self.env.defer(self.deliver, data, dtype, sent_by)
 
-		def propagate(peer):
-			'''
-			Sleep for latency time and call the receiver of the peer
-			'''
-
-			latency = compute_latency(data.getsize(), self.peers[peer])
-			if dtype==1:
-				print("{:.2f}: data {} sent from {} to {}, delay {:.2f}".format(self.env.now, dtype, self.nodeID, peer, latency))
-			yield self.env.timeout(latency)
-			self.call(peer, 'receiver', data, dtype, self.nodeID)
-		
-		for peer in self.peers.keys():
+	def deliver(self, data, dtype, sent_by):
+		'''
+		Draw the latencies for all peers and schedule one timed callback per delivery
+		(of the announcement only with inv relay)
+		'''
+		size, handler = (INV_SIZE, 'announce') if self.relay == 'inv' else (data.getsize(), 'receiver')
+		for k, (peer, edge) in enumerate(zip(self.peers, self.edges)):
 			if peer not in [self.nodeID, sent_by]:
-				self.env.process(propagate(peer))
+				latency = self.network.latency(edge, size)
+				if dtype==1:
+					log.debug('net', "{:.2f}: data {} sent from {} to {}, delay {:.2f}", self.env.now, dtype, self.nodeID, peer, latency)
+				if self.links is not None:
+					self.env.schedule(latency, self.links[k], data, dtype, self.nodeID)
+				else:
+					self.env.schedule(latency, self.call, peer, handler, data, dtype, self.nodeID)
+
+	def announce(self, data, dtype, sent_by):
+		'''
+		Announcement (INV) of a txn or block by sent_by: requested (GETDATA) from it unless already seen or requested
+		'''
+		key = data.hash if dtype == 1 else data.txnID
+		if key in (self.seenBlocks if dtype == 1 else self.seenTxns) or key in self.requested:
+			return
+		self.requested.add(key)
+		self.env.schedule(self.network.latency(self.edge_of[sent_by], INV_SIZE), self.call, sent_by, 'getdata', data, dtype, self.nodeID)
+
+	def getdata(self, data, dtype, requester):
+		'''
+		Request for an announced txn or block: sends the payload to the requester
+		'''
+		self.env.schedule(self.network.latency(self.edge_of[requester], data.getsize()), self.call, requester, 'receiver', data, dtype, self.nodeID)
 
 	def noTxnClash(self, block1, block2):
 		'''
@@ -97,7 +132,7 @@ class Node():
 		set2 = set([t.txnID for t in block2.txns])
 		return not set1.intersection(set2)
 
-	def receiver(self, data, dtype, sent_by, recursive = False):
+	def receiver(self, data, dtype, sent_by):
 		'''
 		If received datatype is a transaction (dtype = 0), then verifies the transaction from the longest chain.
 		Add to transaction pool if verified and broadcast.
@@ -105,47 +140,59 @@ class Node():
 		If received datatype is a block (dtype = 1), then run block checks (chain.py).
 		If verified, add to blockchain, remove its transactions from transaction pool, broadcast.
 		If mining in progress and in clash with potential block, interrupt it and start mining a new block.
-		Run through the outcast block list for potential future blocks recursively.
-		If not verified and previous hash error raised (error code 1), add to outcast block list. 
+		Connect the outcast blocks waiting for the accepted block (and their children, iteratively).
+		If not verified and previous hash error raised (error code 1), add to outcast block pool. 
+		Txns and blocks already seen (seen-sets) are dropped before any verification or relay.
 		'''
 		if dtype==1:
-			print("{:.2f}: data {} received from {} at {}, blk: {}".format(self.env.now, dtype, sent_by, self.nodeID, data.index))
-		if dtype == 0 and (data.txnID not in [t.txnID for t in self.txnPool]) and self.blockchain.verifyTxn(sorted(self.txnPool + [data], key = lambda x: x.timestamp))[0]:
-			self.txnPool.append(data)
-			# print("{:.2f}: data {} broadcasted from {}".format(self.env.now, dtype, self.nodeID))
+			log.debug('net', "{:.2f}: data {} received from {} at {}, blk: {}", self.env.now, dtype, sent_by, self.nodeID, data.index)
+		# seen before: no verification or relay
+		key = data.hash if dtype == 1 else data.txnID
+		if self.requested:
+			self.requested.discard(key)
+		if key in (self.seenBlocks if dtype == 1 else self.seenTxns):
+			return
+
+		if dtype == 0 and (data.txnID not in self.txnPool) and self.blockchain.verifyPendingTxn(data, self.txnPool):
+			self.txnPool.add(data)
+			self.seenTxns.add(data.txnID)
+			# log.debug('net', "{:.2f}: data {} broadcasted from {}", self.env.now, dtype, self.nodeID)
 			self.broadcast(data, dtype, sent_by)
 			# print("start_mining at receiver, dtype=0")
 			self.start_mining()
 
 		elif dtype == 1:
-			if not recursive:
-				blockCheck = self.blockchain.verifyBlockChecks(data)
-			else:
-				blockCheck = 0
-			if blockCheck == 0:	
-				self.addToBlockchain(data, sent_by=sent_by)
-				self.txnPool = self.removeTxn(self.txnPool, data.txns)
-				print("{:.2f}: data {} broadcasted from {}".format(self.env.now, dtype, self.nodeID))
-				# self.broadcast(data, dtype, sent_by)
-
-				# check for potential block clashes when mining in progress
-				if (self.potentialBlock.previous_hash != self.blockchain.longestChainHash(True)) or ((not ((self.potentialBlock is None) or (self.interrupt_time > self.start_mine) or (self.start_mine < self.end_mine)) ) and ((self.potentialBlock.previous_hash == data.previous_hash) or (not self.noTxnClash(data, self.potentialBlock)))):
-					print("{:.2f}: mining interrupted at {}".format(self.env.now, self.nodeID))
-					self.interrupt_time = self.env.now
-				for outcastBlock, sender in self.outcastBlocks:
-					outcastBlockCheck = self.blockchain.verifyBlockChecks(outcastBlock)
-					# 0 - pass
-					# 1 - prev hash not found
-					# 2 - other error (discard)
-					if outcastBlockCheck in [0,2]:
-						self.outcastBlocks.remove((outcastBlock, sender))
-					if outcastBlockCheck == 0:
-						self.receiver(outcastBlock, 1, sender, True)
-						return
+			blockCheck = self.blockchain.verifyBlockChecks(data)
+			# 0 - pass
+			# 1 - prev hash not found
+			# 2 - other error (discard)
+			if blockCheck == 0:
+				accepted = deque([(data, sent_by)])
+				while accepted:
+					block, sender = accepted.popleft()
+					self.seenBlocks.add(block.hash)
+					self.addToBlockchain(block, sent_by=sender)
+					self.txnPool.remove(block.txns)
+					for t in block.txns:
+						self.seenTxns.add(t.txnID)
+					self.blockchain.resetPending()
+					log.debug('net', "{:.2f}: data {} broadcasted from {}", self.env.now, dtype, self.nodeID)
+
+					# check for potential block clashes when mining in progress
+					if (self.potentialBlock.previous_hash != self.blockchain.longestChainHash(True)) or ((not ((self.potentialBlock is None) or (self.interrupt_time > self.start_mine) or (self.start_mine < self.end_mine)) ) and ((self.potentialBlock.previous_hash == block.previous_hash) or (not self.noTxnClash(block, self.potentialBlock)))):
+						log.debug('mine', "{:.2f}: mining interrupted at {}", self.env.now, self.nodeID)
+						self.interrupt_mining()
+
+					# outcast blocks waiting for this block
+					for outcastBlock, outcastSender in self.outcastBlocks.pop(block.hash):
+						if self.blockchain.verifyBlockChecks(outcastBlock) == 0:
+							accepted.append((outcastBlock, outcastSender))
 				# print("start_mining at receiver, dtype=1")
 				self.start_mining()
 			elif blockCheck == 1:
-				self.outcastBlocks.append((data, sent_by))
+				self.outcastBlocks.add(data, sent_by, self.env.now)
+			else:
+				self.seenBlocks.add(data.hash)
 
 	def start_mining(self):
 		'''
@@ -155,66 +202,97 @@ class Node():
 		If not in progress, then also generates a new block. (transaction pool must be non empty in any case)
 		'''
 
-		global TXN_WINDOW
-		self.txnPool = sorted(self.txnPool, key = lambda x: x.timestamp)
-		txnbool = self.blockchain.verifyTxn(self.txnPool)
-
-		self.legitTxnPool = [self.txnPool[i] for i in range(len(txnbool)) if txnbool[i]]
-		# print("{:.2f}: TxnPool {}, pB {}, interrupt {:.2f}, start_mine {:.2f} at node {}, ".format(self.env.now, len(self.legitTxnPool), (self.potentialBlock is None), self.interrupt_time, self.start_mine, self.nodeID))
+		legitTxns = self.blockchain.legitTxns(self.txnPool)
 		
 		# if mining is not in progress
 		# if self.potentialBlock is None or (is interrupted):
 		if (self.potentialBlock is None) or (self.interrupt_time > self.start_mine or self.start_mine < self.end_mine):
 			# print(self.potentialBlock)
 			# print(self.interrupt_time, self.start_mine, self.end_mine)
-			print("{:.2f}: no mining in progress at node {}".format(self.env.now, self.nodeID))
-			if len(self.legitTxnPool)>0:
-				self.env.process(self.generateBlock())
-		else:
-			if len(self.removeTxn(self.legitTxnPool,self.potentialBlock.txns))>0 and self.start_mine + TXN_WINDOW >= self.env.now:
+			log.debug('mine', "{:.2f}: no mining in progress at node {}", self.env.now, self.nodeID)
+			if self.blocks_only or next(legitTxns, None) is not None:
+				self.request_block()
+		elif not self.blocks_only:
+			minedTxnIDs = set([t.txnID for t in self.potentialBlock.txns])
+			if self.start_mine + self.config.txn_window >= self.env.now and any(t.txnID not in minedTxnIDs for t in legitTxns):
 				# print("{:.2f}: mining in progress at node {}".format(self.env.now, self.nodeID))
-				print("{:.2f}: mining interrupted at {}".format(self.env.now, self.nodeID))
-				self.interrupt_time = self.env.now
-				self.env.process(self.generateBlock())
+				log.debug('mine', "{:.2f}: mining interrupted at {}", self.env.now, self.nodeID)
+				self.interrupt_mining()
+				self.request_block()
+
+	def request_block(self):
+		'''
+		Defers generateBlock, once if requested several times in the same instant
+		(a second pending call would build the same block again and redraw its mine delay)
+		'''
+		if not self.generate_pending:
+			self.generate_pending = True
+			self.env.defer(self.generateBlock)
 
 	def generateBlock(self):
 		'''
 		Takes transactions from transaction pool and mines a potential block.
-		Sleeps for mine delay time.
-		Checks if interrupted after waking up.
-		If interrupted, exits normally else broadcasts the mined block to everyone.
+		Schedules minedBlock after the mine delay time (or joins the mining race).
 		'''
 
-		# use first 1000-2 txns to create a block (2 for block header and coinbase txn)
-		txnlist = self.legitTxnPool[:min(len(self.legitTxnPool)+1, 1000-2)]
+		self.generate_pending = False
 		blkID = f'blk{self.nodeID}_{self.blocks_mined}'
-		
-		# check if all txns are valid
-		# extract prev hash from the longest chain, and build potential block on it
-		# add the coinbase txn
-		self.potentialBlock = MinimalBlock(blkID, self.env.now, txnlist, self.blockchain.longestChainHash())
+		if self.blocks_only:
+			# block-only mode: the block holds the transactions generated since its parent was mined
+			prev_hash = self.blockchain.longestChainHash()
+			store = self.blockchain.store
+			elapsed = self.env.now - store.blocks[store.index[prev_hash]].timestamp
+			self.potentialBlock = SummaryBlock(blkID, self.env.now, min(int(elapsed/self.config.txn_delay_mean), 1000-2), prev_hash)
+		else:
+			# use first 1000-2 txns to create a block (2 for block header and coinbase txn)
+			txnlist = list(islice(self.blockchain.legitTxns(self.txnPool), 1000-2))
+
+			# check if all txns are valid
+			# extract prev hash from the longest chain, and build potential block on it
+			# add the coinbase txn
+			self.potentialBlock = MinimalBlock(blkID, self.env.now, txnlist, self.blockchain.longestChainHash())
 		self.potentialBlock.addCoinbaseTxn('cb'+str(self.nodeID)+'_'+str(blkID), self.nodeID, self.env.now)
-		mine_delay = np.random.exponential(MINE_DELAY_MEAN / self.hash_power)
 		self.start_mine = self.env.now
+		if self.race is not None:
+			# the race calls minedBlock if this node wins it
+			log.debug('mine', "{:.2f}: block {} started mining at {}", self.env.now, blkID, self.nodeID)
+			self.race.start(self)
+			return
+		mine_delay = self.rng.exponential(self.config.mine_delay_mean / self.hash_power)
 		sleeptime = self.env.now
 
-		print("{:.2f}: block {} started mining at {}, mine delay {:.2f}".format(self.env.now, blkID, self.nodeID, mine_delay))
-		yield self.env.timeout(mine_delay)
+		log.debug('mine', "{:.2f}: block {} started mining at {}, mine delay {:.2f}", self.env.now, blkID, self.nodeID, mine_delay)
+		self.job.start(mine_delay, blkID, sleeptime)
+
+	def minedBlock(self, blkID, sleeptime):
+		'''
+		Checks if interrupted after waking up.
+		If interrupted, exits normally else broadcasts the mined block to everyone.
+		'''
 
 		# if not interrupted
 		# print(self.env.now, self.interrupt_time, sleeptime, self.nodeID)
-		if self.env.now<freeze_time:
+		if self.env.now<self.config.freeze_time:
 			if not (self.interrupt_time > sleeptime):
 				self.blocks_mined += 1
 				self.potentialBlock.timestamp = self.env.now
 				self.end_mine = self.env.now
+				self.seenBlocks.add(self.potentialBlock.hash)
 				self.addToBlockchain(self.potentialBlock, sent_by=self.nodeID)
-				self.txnPool = self.removeTxn(self.txnPool, self.potentialBlock.txns)
-				print("\n{:.2f}: block {} mined at {}".format(self.env.now, blkID, self.nodeID))
+				self.txnPool.remove(self.potentialBlock.txns)
+				self.blockchain.resetPending()
+				log.info('mine', "\n{:.2f}: block {} mined at {}", self.env.now, blkID, self.nodeID)
 				# self.broadcast(self.potentialBlock, 1, self.nodeID)
 			# print("start_mining at gen_blk")
 			self.start_mining()
 
 
-	def freeze_mine(self):
+	def interrupt_mining(self):
+		'''
+		Interrupts the block being mined (its mining event is cancelled)
+		'''
 		self.interrupt_time = self.env.now
+		self.job.interrupt()
+
+	def freeze_mine(self):
+		self.interrupt_mining()
@@ -0,0 +1,124 @@
+'''
+Opt-in profiling of the hot simulation functions: call counts, cumulative time and item counts
+(pool size, tree size, path length, ...) per node type and function.
+The functions are wrapped only while the profiler is enabled, so a disabled profiler costs nothing.
+'''
+import sys
+import functools
+from time import perf_counter
+from chain import MinimalChain, BlockStore
+from node import Node
+from attacks import SelfishNode, StubbornNode
+
+# class -> {function: item count of a call (None: no items)}, node classes set the node type of nested calls
+NODE_TARGETS = {
+	Node: {
+		'gen_txn': lambda node, txn: len(node.txnPool),
+		'receiver': lambda node, data, dtype, sent_by: len(node.txnPool),
+		'broadcast': lambda node, data, dtype, sent_by: len(node.peers),
+		'deliver': lambda node, data, dtype, sent_by: len(node.peers),
+		'announce': None,
+		'getdata': None,
+		'start_mining': lambda node: len(node.txnPool),
+		'generateBlock': lambda node: len(node.txnPool),
+		'minedBlock': None,
+		'addToBlockchain': lambda node, block, sent_by: node.blockchain.block_count,
+	},
+	SelfishNode: {'addToBlockchain': lambda node, block, sent_by: node.blockchain.block_count},
+	StubbornNode: {'addToBlockchain': lambda node, block, sent_by: node.blockchain.block_count},
+}
+TARGETS = {
+	MinimalChain: {
+		'add_block': lambda chain, block, *args, **kwargs: chain.block_count,
+		'verifyBlockChecks': lambda chain, block, *args, **kwargs: len(block.txns),
+		'verifyTxn': lambda chain, txnlist: len(txnlist),
+		'verifyPendingTxn': lambda chain, txn, txnPool: len(txnPool),
+		'syncPending': lambda chain, txnPool: len(txnPool),
+		'longestChainHash': lambda chain, *args: chain.block_count,
+		'get_chain_lengths': lambda chain: chain.block_count,
+	},
+	BlockStore: {
+		'add': lambda store, block: len(store),
+		'get_balances': lambda store, num: store.height[num] % store.checkpoint,		# deltas applied
+	},
+}
+
+class Profiler():
+	'''
+	Stats by (node type, function): [calls, cumulative seconds, total items, max items]
+	'''
+	def __init__(self):
+		self.enabled = False
+		self.stats = {}
+		self.context = '-'			# type of the node whose handler is running
+		self.originals = []
+
+	def enable(self):
+		'''
+		Wraps the target functions (before the nodes are linked, which binds their receivers)
+		'''
+		if self.enabled:
+			return
+		for targets, is_node in ((NODE_TARGETS, True), (TARGETS, False)):
+			for cls, functions in targets.items():
+				for name, items in functions.items():
+					func = cls.__dict__[name]
+					self.originals.append((cls, name, func))
+					setattr(cls, name, self.wrap(cls, name, func, items, is_node))
+		self.enabled = True
+
+	def disable(self):
+		for cls, name, func in reversed(self.originals):
+			setattr(cls, name, func)
+		self.originals = []
+		self.enabled = False
+
+	def reset(self):
+		self.stats.clear()
+
+	def wrap(self, cls, name, func, items, is_node):
+		prof = self
+		stats = self.stats
+		qualname = cls.__name__ + '.' + name
+
+		@functools.wraps(func)
+		def wrapper(obj, *args, **kwargs):
+			if is_node:
+				previous = prof.context
+				prof.context = type(obj).__name__
+			key = (prof.context, qualname)
+			count = items(obj, *args, **kwargs) if items is not None else 0
+			start = perf_counter()
+			try:
+				return func(obj, *args, **kwargs)
+			finally:
+				elapsed = perf_counter() - start
+				s = stats.get(key)
+				if s is None:
+					s = stats[key] = [0, 0.0, 0, 0]
+				s[0] += 1
+				s[1] += elapsed
+				s[2] += count
+				if count > s[3]:
+					s[3] = count
+				if is_node:
+					prof.context = previous
+		return wrapper
+
+	def as_dict(self):
+		return {"{}:{}".format(*key): {'calls': s[0], 'time': s[1], 'items': s[2], 'max_items': s[3]} for key, s in self.stats.items()}
+
+	def table(self, stream=None, top=None, title='profile'):
+		'''
+		Writes the stats sorted by cumulative time (inclusive of nested calls)
+		'''
+		stream = stream or sys.stdout
+		rows = sorted(self.stats.items(), key = lambda r: -r[1][1])[:top]
+		stream.write("------------------------\n{}\n".format(title))
+		stream.write("{:<14}{:<34}{:>10}{:>11}{:>11}{:>11}{:>10}\n".format('node type', 'function', 'calls', 'total(s)', 'per call', 'items/call', 'max items'))
+		for (node_type, qualname), (calls, total, items, max_items) in rows:
+			stream.write("{:<14}{:<34}{:>10}{:>11.3f}{:>10.1f}u{:>11.1f}{:>10}\n".format(node_type, qualname, calls, total, 1e6*total/calls, items/calls, max_items))
+
+
+# shared profiler, enabled by Simulation when config.profile is set
+prof = Profiler()
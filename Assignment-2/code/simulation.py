@@ -0,0 +1,304 @@
+'''
+One simulation run: its parameters (SimulationConfig) and state (Simulation), so that several runs
+can live in one process.
+'''
+import os
+import time
+import pickle
+import numpy as np
+from network import nodes_generator
+from kernel import KERNELS
+from logger import log
+from chain import MinimalTxn, TxnTable, BlockStore
+from blocktrace import TraceWriter, to_logs
+from node import Node
+from mining import MiningRace
+from attacks import SelfishNode, StubbornNode
+from visualise import plot_ratio
+from profiler import prof
+from constants import *
+
+class SimulationConfig():
+	'''
+	Parameters of a simulation run, defaults from constants.py
+	'''
+	def __init__(self, **params):
+		# network config
+		self.n = N
+		self.fast_ratio = FAST_RATIO
+		self.seed = SEED
+		self.graph_seed = SEED			# seed of the honest powerlaw graph
+		self.random_hash = False		# uniform random (True) or equal (False) honest hash powers
+		self.selfish = SELFISH
+		self.stubborn = STUBBORN
+		self.adv_hash_power = ADV_HASH_POWER
+		self.adv_gamma = ADV_GAMMA
+		self.latency_block = LATENCY_BLOCK
+		# sim config
+		self.starttime = starttime
+		self.endtime = endtime
+		self.freeze_time = None			# endtime - 50 if not given
+		self.log_endtime = None			# endtime - 1 if not given
+		self.kernel = KERNEL
+		self.results_dir = RESULTS_DIR
+		self.trace_path = None			# <results_dir>/blocks if not given
+		self.checkpoint_every = CHECKPOINT_EVERY	# simulation seconds between snapshots (None: no snapshots)
+		self.checkpoint_path = None		# <results_dir>/checkpoint.pkl if not given
+		self.profile = PROFILE			# count and time the hot functions (profiler.py)
+		self.profile_every = PROFILE_EVERY	# simulation seconds between profile dumps (None: only at the end)
+		# txn config
+		self.commission_rate = commission_rate
+		self.txn_delay_mean = TXN_EXP_DIST_MEAN
+		self.init_balance = INIT_BALANCE
+		self.txn_table = TXN_TABLE
+		self.blocks_only = BLOCKS_ONLY		# no transactions, block sizes from the transaction rate
+		# node params
+		self.txn_window = TXN_WINDOW
+		self.mining = MINING			# 'node': a mining timer per node, 'race': one superposed race event (mining.py)
+		self.mine_delay_mean = MINE_DELAY_MEAN
+		self.orphan_pool_size = ORPHAN_POOL_SIZE
+		self.orphan_max_age = ORPHAN_MAX_AGE
+		self.seen_size = SEEN_SIZE		# txn/block IDs remembered per node to drop duplicates (0: none)
+		self.relay = RELAY				# 'push': payloads to all peers, 'inv': announce, peers fetch unseen data
+		self.balance_checkpoint = BALANCE_CHECKPOINT
+
+		for key, value in params.items():
+			if not hasattr(self, key):
+				raise TypeError(f"unknown simulation parameter '{key}'")
+			setattr(self, key, value)
+		if self.freeze_time is None:
+			self.freeze_time = self.endtime - 50
+		if self.log_endtime is None:
+			self.log_endtime = self.endtime - 1
+		if self.trace_path is None:
+			self.trace_path = os.path.join(self.results_dir, "blocks")
+		if self.checkpoint_path is None:
+			self.checkpoint_path = os.path.join(self.results_dir, "checkpoint.pkl")
+		if self.mining not in MINING_MODES:
+			raise ValueError(f"unknown mining mode '{self.mining}'")
+		if self.relay not in RELAY_MODES:
+			raise ValueError(f"unknown relay mode '{self.relay}'")
+		if self.checkpoint_every and self.kernel != 'heap':
+			raise ValueError("checkpoints need the heap kernel (SimPy events can not be pickled)")
+
+	@property
+	def honest_n(self):
+		return self.n - (self.selfish + self.stubborn)
+
+	@property
+	def discretizer(self):
+		return self.txn_delay_mean/2
+
+	def as_dict(self):
+		return dict(vars(self))
+
+
+class Simulation():
+	'''
+	State of a simulation run: event kernel, random state, network, nodes, block store and trace
+	'''
+	def __init__(self, config):
+		self.config = config
+		self.rng = np.random.RandomState(config.seed)
+		self.env = KERNELS[config.kernel]()
+		self.txn_count = 0
+		self.nodeIDs = []
+		self.network = None
+		self.node_map = {}
+		self.store = None
+		self.trace = None
+		self.race = None		# mining.MiningRace with config.mining 'race'
+		self.txns = None		# generated transactions (transmitters, drawees, payees, amounts, table)
+		self.wall_time = 0		# wall clock seconds spent in run(), over all resumes
+		self.summary = {}		# run metrics, filled by blk_analytics
+
+	def call(self, nodeID, func, *args):
+		'''
+		To call node functions by reference
+		'''
+		return getattr(self.node_map[nodeID], func)(*args)
+
+	def get_hash_powers(self):
+		'''
+		Equal or uniformly sampled hash power fractions for the honest nodes, ADV_HASH_POWER for the adversaries
+		'''
+		config = self.config
+		honest_n = config.honest_n
+		if config.random_hash:
+			hash_powers = self.rng.uniform(size=honest_n)
+			hash_powers /= np.sum(hash_powers)
+			hash_powers *= (1 - config.adv_hash_power*(config.n - honest_n))
+			return list(hash_powers) + [config.adv_hash_power]*(config.n - honest_n)
+		return [(1 - config.adv_hash_power*(config.n - honest_n))/honest_n]*honest_n + [config.adv_hash_power]*(config.n - honest_n)
+
+	def init_accounts(self):
+		'''
+		Generate transaction list for genesis block with same initial balance for all
+		'''
+		return [MinimalTxn(self.txn_count+i, -1, self.nodeIDs[i], self.env.now, self.config.init_balance, 0) for i in range(len(self.nodeIDs))]
+
+	def get_node_map(self, genesis_txns, fast_nodes, hash_powers):
+		'''
+		Centrally stored node objects in node map
+		All nodes share one block store, each keeps its own view of it, block arrivals go to one trace
+		'''
+		nodeIDs = self.nodeIDs
+		i = 0
+		tmp_map1 = {}
+		if self.config.selfish:
+			tmp_map1[nodeIDs[-1-i]] = SelfishNode(self, nodeIDs[-1-i], genesis_txns, is_fast=fast_nodes[-1-i], hash_power = hash_powers[-1-i], store = self.store, trace = self.trace)
+			i = i+1
+		if self.config.stubborn:
+			tmp_map1[nodeIDs[-1-i]] = StubbornNode(self, nodeIDs[-1-i], genesis_txns, is_fast=fast_nodes[-1-i], hash_power = hash_powers[-1-i], store = self.store, trace = self.trace)
+			i = i+1
+		tmp_map2 = {nodeID: Node(self, nodeID, genesis_txns, is_fast=fast_nodes[it], hash_power = hash_powers[it], store = self.store, trace = self.trace) for it, nodeID in enumerate(nodeIDs if i==0 else nodeIDs[:-i])}
+		return {**tmp_map1, **tmp_map2}
+
+	def setup(self):
+		'''
+		Samples the network, creates the nodes and schedules the generators
+		'''
+		config = self.config
+		os.makedirs(config.results_dir, exist_ok=True)
+
+		# sampling hash power percentages for each node
+		hash_powers = self.get_hash_powers()
+		print("hash powers: ", hash_powers)
+
+		# samples N node connected graph with fast nodes randomly distributed
+		self.nodeIDs, self.network, fast_nodes = nodes_generator(config, self.rng)
+		# generate transaction list for genesis block with same initial balance for all
+		genesis_txns = self.init_accounts()
+		# centrally stored node objects in node map
+		self.store = BlockStore(0, genesis_txns, config.balance_checkpoint)
+		self.trace = TraceWriter(config.trace_path, self.store)
+		if config.mining == 'race':
+			self.race = MiningRace(self.env, self.rng, config.mine_delay_mean)
+		self.node_map = self.get_node_map(genesis_txns, fast_nodes, hash_powers)
+		for node in self.node_map.values():
+			node.link(self.node_map)
+		print("network initialised to \n{} with ID map \n{}".format(self.network, self.nodeIDs, self.node_map))
+
+		if config.blocks_only:
+			for nodeID in self.nodeIDs:
+				self.env.defer(self.node_map[nodeID].start_mining)
+		else:
+			self.env.defer(self.transaction_generator)
+		self.env.defer(self.env.schedule, config.freeze_time, self.freeze_all)
+		self.env.defer(self.env.schedule, config.log_endtime, self.blk_analytics)
+		if config.profile and config.profile_every:
+			self.env.defer(self.env.schedule, config.profile_every, self.profile_dump)
+
+	def transaction_generator(self):
+		'''
+		Randomly generates list of transactions (drawee, payee, amounts).
+		Broadcasts them from drawee node.
+		Schedules the next transaction after an exponentially distributed time interval
+		'''
+		config = self.config
+		count = int((config.endtime-config.starttime)/config.discretizer) + 1
+		drawees = self.rng.choice(self.nodeIDs, count, replace = True)
+		payees = self.rng.choice(self.nodeIDs, count, replace = True)
+		transmitters = drawees.copy()
+		amounts = self.rng.uniform(1.0, 10.0, count)
+		print("*Trans generator*\ntransmitter:{}\ndrawees:{}\npayees:{}\namounts:{}".format(transmitters, drawees, payees, amounts))
+		txn_table = TxnTable(len(transmitters)) if config.txn_table else None
+		self.txns = (transmitters, drawees, payees, amounts, txn_table)
+		self.next_txn()
+
+	def next_txn(self):
+		config = self.config
+		env = self.env
+		transmitters, drawees, payees, amounts, txn_table = self.txns
+		if self.txn_count<len(transmitters) and env.now<config.freeze_time:
+			self.txn_count+=1
+			k = self.txn_count-1
+			if txn_table is not None:
+				txn = txn_table.add(f'tx{transmitters[k]}_{self.txn_count}', drawees[k], payees[k], env.now, amounts[k], config.commission_rate * amounts[k])
+			else:
+				txn = MinimalTxn(f'tx{transmitters[k]}_{self.txn_count}', drawees[k], payees[k], env.now, amounts[k], config.commission_rate * amounts[k])
+			self.call(transmitters[k], 'gen_txn', txn)
+			timeout = self.rng.exponential(config.txn_delay_mean)
+			env.schedule(timeout, self.next_txn)
+
+	def freeze_all(self):
+		for i in self.nodeIDs:
+			self.call(self.nodeIDs[i], 'freeze_mine')
+
+	def profile_dump(self):
+		'''
+		Periodic profile table, reschedules itself
+		'''
+		prof.table(title = "profile at {:.2f}".format(self.env.now))
+		self.env.schedule(self.config.profile_every, self.profile_dump)
+
+	def blk_analytics(self):
+		'''
+		Extracts miner info from blockchain from nodes and block logs from the trace.
+		Plot graphs at log_endtime (T-x seconds)
+		'''
+		nodeIDs = self.nodeIDs
+		miner_info = list(zip(*[self.call(nodeID, 'get_miner_info') for nodeID in nodeIDs]))
+		blockchains = list(self.call(nodeIDs[i], 'get_blockchain') for i in nodeIDs)
+		self.trace.flush()
+		logs = to_logs(self.trace.path, nodeIDs)
+		print("hello")
+		self.summary.update(plot_ratio(self.config, nodeIDs, miner_info, blockchains, logs))
+
+	def save(self, path):
+		'''
+		Writes a snapshot of the whole simulation (chains, pools, pending events, random states) to path.
+		Written to a temporary file first, so a crash while saving keeps the previous snapshot.
+		'''
+		tmp = path + '.tmp'
+		with open(tmp, 'wb') as f:
+			pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(tmp, path)
+		log.info('chain', "{:.2f}: snapshot written to {}", self.env.now, path)
+
+	@staticmethod
+	def load(path):
+		'''
+		Simulation from a snapshot written by save(), run() continues it where it stopped
+		'''
+		with open(path, 'rb') as f:
+			return pickle.load(f)
+
+	def run(self):
+		'''
+		Runs the simulation to endtime (snapshot every checkpoint_every seconds if set),
+		returns the summary (metrics, config, events processed and wall time)
+		'''
+		config = self.config
+		if config.profile:
+			prof.reset()		# stats of this run only
+			if not prof.enabled:
+				prof.enable()		# before setup links the nodes
+				for node in self.node_map.values():
+					node.link(self.node_map)		# resumed snapshot: rebind to the wrapped receivers
+		try:
+			if self.network is None:
+				self.setup()
+			wall_start, wall_time = time.time(), self.wall_time
+			while self.env.now < config.endtime:
+				until = min(self.env.now + config.checkpoint_every, config.endtime) if config.checkpoint_every else config.endtime
+				self.env.run(until = until)
+				self.wall_time = wall_time + time.time() - wall_start
+				if until < config.endtime:
+					self.save(config.checkpoint_path)
+		except BaseException:
+			log.dump()
+			raise
+		finally:
+			if config.profile:
+				prof.disable()		# later runs in the process are not wrapped
+		self.trace.close()
+		print("------------------------\nSimulation Complete")
+		print("kernel {}: {} events in {:.2f}s ({:.0f} events/sec)".format(config.kernel, self.env.events, self.wall_time, self.env.events/max(self.wall_time, eps)))
+		self.summary.update(config = config.as_dict(), events = self.env.events, wall_time = self.wall_time)
+		if config.profile:
+			prof.table()
+			self.summary.update(profile = prof.as_dict())
+		return self.summary
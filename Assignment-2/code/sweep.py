@@ -0,0 +1,116 @@
+'''
+Parameter sweeps: runs every point of a grid of (N, Z, MINE_DELAY_MEAN, TXN_EXP_DIST_MEAN, seed, adversary mode)
+on a process pool. Each point runs in <sweep dir>/points/<config hash>/ and is skipped if it already has a summary,
+so re-running a sweep only computes the missing points. All points are collected in <sweep dir>/results.csv.
+'''
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from simulation import SimulationConfig, Simulation
+from constants import *
+
+MODES = {'honest': {}, 'selfish': {'selfish': True}, 'stubborn': {'stubborn': True}}
+COLUMNS = ['n', 'fast', 'mine', 'txn', 'seed', 'mode', 'endtime', 'hash', 'chain_length', 'MPU_overall', 'MPU_adv', 'adv_fraction', 'events', 'wall_time']
+
+def config_hash(point):
+	return hashlib.sha1(json.dumps(point, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def grid(args):
+	'''
+	All points of the sweep (dicts of the simulation parameters)
+	'''
+	keys = ['n', 'fast', 'mine', 'txn', 'seed', 'mode']
+	# same types for CLI values and defaults, so equal points get equal hashes
+	values = [[int(x) for x in args.n], [float(x) for x in args.fast], [float(x) for x in args.mine], [float(x) for x in args.txn], [int(x) for x in args.seed], args.mode]
+	extra = {'blocks_only': True} if args.blocksonly else {}		# only when set, so earlier point hashes stay valid
+	return [dict(zip(keys, combo), endtime=float(args.endtime), **extra) for combo in itertools.product(*values)]
+
+def run_point(point, point_dir):
+	'''
+	Runs the simulation for the point in point_dir (output in run.log), returns its summary
+	'''
+	os.makedirs(point_dir, exist_ok=True)
+	summary_path = os.path.join(point_dir, 'summary.json')
+	config = SimulationConfig(n = point['n'], fast_ratio = point['fast'], mine_delay_mean = point['mine'], txn_delay_mean = point['txn'],
+		seed = point['seed'], endtime = point['endtime'], blocks_only = point.get('blocks_only', False), results_dir = point_dir, **MODES[point['mode']])
+	with open(os.path.join(point_dir, 'run.log'), 'w') as f, redirect_stdout(f):
+		summary = Simulation(config).run()
+	with open(summary_path + '.tmp', 'w') as f:
+		json.dump(summary, f, indent=1)
+	os.replace(summary_path + '.tmp', summary_path)		# a point counts as done only once its summary is complete
+	return summary
+
+def load_point(point_dir):
+	'''
+	Summary of a finished point, None if missing
+	'''
+	try:
+		with open(os.path.join(point_dir, 'summary.json')) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+def write_table(path, points, summaries):
+	with open(path, 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(COLUMNS)
+		for point in points:
+			summary = summaries.get(config_hash(point))
+			if summary is None:
+				continue
+			row = {**point, **summary, 'hash': config_hash(point)}
+			writer.writerow([row.get(col, '') for col in COLUMNS])
+
+def sweep(points, sweep_dir, workers=None):
+	'''
+	Runs the missing points in parallel, returns summaries by config hash
+	'''
+	summaries = {}
+	missing = []
+	for point in points:
+		key = config_hash(point)
+		summary = load_point(os.path.join(sweep_dir, 'points', key))
+		if summary is not None:
+			summaries[key] = summary
+		elif key not in [config_hash(p) for p in missing]:
+			missing.append(point)
+	print("{} points, {} cached, {} to run".format(len(points), len(points) - len(missing), len(missing)))
+
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		futures = {pool.submit(run_point, point, os.path.join(sweep_dir, 'points', config_hash(point))): point for point in missing}
+		for future in as_completed(futures):
+			point = futures[future]
+			try:
+				summaries[config_hash(point)] = future.result()
+				print("done: {}".format(point))
+			except Exception as e:
+				print("failed: {} ({!r}, see {})".format(point, e, os.path.join(sweep_dir, 'points', config_hash(point), 'run.log')))
+	return summaries
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Parameter sweep over the simulation')
+	parser.add_argument('-name', metavar='NAME', type=str, required=True, help='sweep name (output in <dir>/<name>)')
+	parser.add_argument('-dir', metavar='D', type=str, default='../sweeps', help='directory holding the sweeps')
+	parser.add_argument('-n', metavar='N', type=int, nargs='+', default=[N], help='numbers of peers')
+	parser.add_argument('-fast', metavar='Z', type=float, nargs='+', default=[FAST_RATIO], help='fast peer ratios')
+	parser.add_argument('-mine', metavar='MD', type=float, nargs='+', default=[MINE_DELAY_MEAN], help='mean mining delays')
+	parser.add_argument('-txn', metavar='TD', type=float, nargs='+', default=[TXN_EXP_DIST_MEAN], help='mean transaction delays')
+	parser.add_argument('-seed', metavar='S', type=int, nargs='+', default=[SEED], help='random seeds')
+	parser.add_argument('-mode', metavar='M', type=str, nargs='+', default=['honest'], choices=list(MODES.keys()), help='adversary modes')
+	parser.add_argument('-endtime', metavar='T', type=float, default=endtime, help='simulation end time (seconds)')
+	parser.add_argument('-blocksonly', metavar='BO', type=bool, default=BLOCKS_ONLY, help='block-only mode (transactions in aggregate)')
+	parser.add_argument('-workers', metavar='W', type=int, default=None, help='worker processes (default: all cores)')
+	args = parser.parse_args()
+
+	sweep_dir = os.path.abspath(os.path.join(args.dir, args.name))
+	points = grid(args)
+	summaries = sweep(points, sweep_dir, args.workers)
+	write_table(os.path.join(sweep_dir, 'results.csv'), points, summaries)
+	print("results in {}".format(os.path.join(sweep_dir, 'results.csv')))
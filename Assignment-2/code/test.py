@@ -1,12 +1,15 @@
+import os
 from constants import *
 from chain import *
 from network import *
 from attacks import *
-from main import *
+from simulation import SimulationConfig
 from typing import NamedTuple
 
-nodeIDs, conn, _ = nodes_generator(N, HONEST_N, FAST_RATIO)
-genesis_txns = [MinimalTxn(TxnID+i, -1, nodeIDs[i], 0, INIT_BALANCE, 0) for i in range(len(nodeIDs))]
+config = SimulationConfig()
+os.makedirs(config.results_dir, exist_ok=True)
+nodeIDs, network, _ = nodes_generator(config, np.random.RandomState(config.seed))
+genesis_txns = [MinimalTxn(i, -1, nodeIDs[i], 0, config.init_balance, 0) for i in range(len(nodeIDs))]
 
 blockchain = MinimalChain(0, genesis_txns)
 # transmitters = np.random.choice(nodeIDs, int((endtime-starttime)/DISCRETIZER) + 1, replace = True)
@@ -26,9 +29,9 @@ print(blockchain.longestChainHash())
 blk = MinimalBlock(blkID, 3, [], blockchain.longestChainHash())
 blk.addCoinbaseTxn('cb'+str(nodeID)+'_'+str(blkID), nodeID, 3)
 
-# print(blockchain.blockchainTree.balances)
+# print(blockchain.store.get_balances(blockchain.tip))
 blockchain.add_block(blk)
-# print(blockchain.blockchainTree.balances)
+# print(blockchain.store.get_balances(blockchain.tip))
 
 print(blockchain.get_chain_lengths())
 
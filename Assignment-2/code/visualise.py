@@ -1,3 +1,4 @@
+import os
 import networkx as nx
 import matplotlib.pyplot as plt
 from constants import *
@@ -17,23 +18,26 @@ def plot_blockchain(logs):
 		blks[Hash] = blkNode(name=index+"("+miner+")", parent=blks[prevHash])
 	print_tree(blks[genesis_hash], horizontal=True)
 
-def print_graph(connx, colors, filename="../results/network"):
+def print_graph(connx, colors, filename="../results/network", rng=None):
 	'''
-	Plots the sampled network
+	Plots the sampled network (layout drawn from rng, the global random state if None)
 	'''
 	plt.figure()
-	nx.draw_networkx(connx, node_color=colors, font_color='white')
+	nx.draw_networkx(connx, pos=nx.spring_layout(connx, seed=rng), node_color=colors, font_color='white')
 	plt.savefig(filename+'.png')
 
-def plot_ratio(nodeIDs, miner_info, blockchains, honest_n):
+def plot_ratio(config, nodeIDs, miner_info, blockchains, logs):
 	'''
 	Plots (1) Hash power vs Mining ratios and (2) Fast/slow nodes vs Mining ratios.
 	Generates log files for each node in the format:
-		Block Hash, Block Number, Arrival/Mining Time, Previous Hash
+		Block Hash, Block Number, Arrival/Mining Time, Previous Hash, Miner
+	Returns the run metrics (mining ratios, MPU_adv, MPU_overall, ...)
 	'''
 	miners = []
+	honest_n = config.honest_n
+	tag = f"N{config.n}_Z{config.fast_ratio}_MINEDELAY{config.mine_delay_mean}_TXNDELAY{config.txn_delay_mean}"
 	
-	blocks_mined, is_fast, hash_power, logs = miner_info
+	blocks_mined, is_fast, hash_power = miner_info
 
 
 	print(f'''\n---------------------------\nNODE DETAILS: \nblocks mined: {blocks_mined}\nis fast: {is_fast}\nhash power: {[float('{:.2f}'.format(x)) for x in hash_power]}\n''')
@@ -45,7 +49,7 @@ def plot_ratio(nodeIDs, miner_info, blockchains, honest_n):
 		if i==0:
 			miners += singleMine
 		plot_blockchain(logs[i])
-		with open(f"../results/blockchains_{nodeIDs[i]}.txt", 'w') as f:
+		with open(os.path.join(config.results_dir, f"blockchains_{nodeIDs[i]}.txt"), 'w') as f:
 			f.writelines(logs[i])
 			# with redirect_stdout(f):
 			# 	blockchain.write()
@@ -54,10 +58,14 @@ def plot_ratio(nodeIDs, miner_info, blockchains, honest_n):
 	print(f"\nMining ratios: {[float('{:.4f}'.format(x)) for x in mining_ratio]}\n")
 
 
+	metrics = {'blocks_mined': [int(x) for x in blocks_mined], 'mining_ratios': mining_ratio, 'chain_length': len(singleMine)}
 	if honest_n!=len(nodeIDs):
-		print("Effective fraction of chain = ", singleMine.count(nodeIDs[-1])/len(singleMine))
-		print("MPU_adv = ", singleMine.count(nodeIDs[-1])/((blocks_mined[-1] + eps)))
-	print("MPU_overall = ", len(singleMine)/sum(blocks_mined))
+		metrics['adv_fraction'] = singleMine.count(nodeIDs[-1])/len(singleMine)
+		metrics['MPU_adv'] = singleMine.count(nodeIDs[-1])/((blocks_mined[-1] + eps))
+		print("Effective fraction of chain = ", metrics['adv_fraction'])
+		print("MPU_adv = ", metrics['MPU_adv'])
+	metrics['MPU_overall'] = len(singleMine)/sum(blocks_mined)
+	print("MPU_overall = ", metrics['MPU_overall'])
 
 
 	fastMiners = [mining_ratio[i] for i in range(len(mining_ratio)) if is_fast[i]]
@@ -69,13 +77,16 @@ def plot_ratio(nodeIDs, miner_info, blockchains, honest_n):
 	plt.ylabel("Mining Ratio")
 	# plt.xlim([0,1])
 	plt.ylim([-0.2,1.2])
-	plt.title(f"N{N}_Z{FAST_RATIO}_MINEDELAY{MINE_DELAY_MEAN}_TXNDELAY{TXN_EXP_DIST_MEAN}")
-	plt.savefig(f'../results/hashpower_vs_ratios_N{N}_Z{FAST_RATIO}_MINEDELAY{MINE_DELAY_MEAN}_TXNDELAY{TXN_EXP_DIST_MEAN}.png')
+	plt.title(tag)
+	plt.savefig(os.path.join(config.results_dir, f'hashpower_vs_ratios_{tag}.png'))
 
 	plt.figure()
 	plt.boxplot([slowMiners, fastMiners])
 	plt.xlabel("Slow nodes: 1, Fast nodes: 2")
 	plt.ylabel("Mining Ratio")
 	plt.ylim([-0.2,1.2])
-	plt.title(f"N{N}_Z{FAST_RATIO}_MINEDELAY{MINE_DELAY_MEAN}_TXNDELAY{TXN_EXP_DIST_MEAN}")
-	plt.savefig(f'../results/fast_vs_ratios_N{N}_Z{FAST_RATIO}_MINEDELAY{MINE_DELAY_MEAN}_TXNDELAY{TXN_EXP_DIST_MEAN}.png')
\ No newline at end of file
+	plt.title(tag)
+	plt.savefig(os.path.join(config.results_dir, f'fast_vs_ratios_{tag}.png'))
+	plt.close('all')
+
+	return metrics